@@ -2,7 +2,7 @@
 
 import numpy as np
 
-def create_position(nframes=10**6):
+def create_position(nframes=10**6, out=None):
     """Get array of x, y, and z position of a particle with time.
 
     Parameters
@@ -10,6 +10,8 @@ def create_position(nframes=10**6):
     nframes: int
         number of frames; more frames increases the resolution
         of the trajectory, but not its length
+    out : array, optional
+        `nframes` x 3 array to write the positions into
 
     Returns
     -------
@@ -17,14 +19,14 @@ def create_position(nframes=10**6):
         (x, y, z) position of the particle with time
 
     """
-    # generate x, y, z positions
-    x = np.cos(np.linspace(0, 20, nframes))
-    y = 3 * np.sin(np.linspace(0, 10, nframes))
-    z = -2 * np.sin(np.pi * np.linspace(0, 5, nframes))
+    # the array has the [[x, y, z], [x, y, z], ...] shape and is
+    # C-contiguous: the x, y, z of one frame are next to each other
+    # in memory
+    position = np.empty((nframes, 3)) if out is None else out
 
-    # put them all in a single array; this gives
-    # an array with 3 rows and nframes columns
-    position = np.array([x, y, z])
+    # generate x, y, z positions
+    position[:, 0] = np.cos(np.linspace(0, 20, nframes))
+    position[:, 1] = 3 * np.sin(np.linspace(0, 10, nframes))
+    position[:, 2] = -2 * np.sin(np.pi * np.linspace(0, 5, nframes))
 
-    # transposing puts the array into the [[x, y, z], [x, y, z], ...] shape
-    return position.transpose()
+    return position
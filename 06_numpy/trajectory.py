@@ -0,0 +1,183 @@
+# trajectory generation and analysis for lesson 06 numpy
+#
+# Trajectories are (nframes, 3) arrays of positions (as from
+# helpers.create_position()). For very long trajectories (10^8 frames
+# need 2.4 GB) the positions can be written into a memory-mapped
+# .npy file and all analysis functions work on chunks of frames, so
+# that only `chunksize` frames are in memory at any time.
+
+import numpy as np
+
+def _linspace_chunk(start, stop, num, first, last):
+    """Elements [first:last] of ``np.linspace(start, stop, num)``.
+
+    Calculated in the same way as numpy.linspace so that the values
+    are identical.
+    """
+    div = num - 1
+    y = np.arange(first, last, dtype=np.float64)
+    if div > 0:
+        y = y * ((stop - start) / div) + start
+        if last == num:
+            # numpy.linspace sets the end point exactly
+            y[-1] = stop
+    else:
+        y = y * (stop - start) + start
+    return y
+
+def create_trajectory(nframes=10**6, filename=None, chunksize=10**6):
+    """Create the trajectory of helpers.create_position() in chunks.
+
+    Parameters
+    ----------
+    nframes : int
+        number of frames
+    filename : str, optional
+        write the positions into a memory-mapped ``.npy`` file instead
+        of an array in memory (load it later with
+        ``np.load(filename, mmap_mode="r")``)
+    chunksize : int
+        number of frames that are calculated at a time
+
+    Returns
+    -------
+    position : `nframes` x 3 array or numpy.memmap
+        C-contiguous (x, y, z) positions, identical to
+        ``create_position(nframes)``
+
+    """
+    if filename is None:
+        position = np.empty((nframes, 3))
+    else:
+        position = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64,
+                                             shape=(nframes, 3))
+    for first in range(0, nframes, chunksize):
+        last = min(first + chunksize, nframes)
+        chunk = position[first:last]
+        chunk[:, 0] = np.cos(_linspace_chunk(0, 20, nframes, first, last))
+        chunk[:, 1] = 3 * np.sin(_linspace_chunk(0, 10, nframes, first, last))
+        chunk[:, 2] = -2 * np.sin(np.pi * _linspace_chunk(0, 5, nframes, first, last))
+    if filename is not None:
+        position.flush()
+    return position
+
+def iter_chunks(position, chunksize=10**6):
+    """Yield ``(first, chunk)`` with consecutive chunks of frames.
+
+    `chunk` is ``position[first:first + chunksize]`` (a view, which
+    for a memmap is only read from disk when it is used).
+    """
+    for first in range(0, len(position), chunksize):
+        yield first, position[first:first + chunksize]
+
+def displacement(position, origin=None, chunksize=10**6, out=None):
+    """Distance of each frame from `origin` (default: the first frame).
+
+    Parameters
+    ----------
+    position : `nframes` x 3 array
+        positions (can be a memmap)
+    origin : array, optional
+        reference position; the default is ``position[0]``
+    chunksize : int
+        number of frames processed at a time
+    out : array, optional
+        array of length `nframes` for the result (can be a memmap)
+
+    Returns
+    -------
+    d : array
+        |r(t) - origin| for all frames
+    """
+    origin = position[0] if origin is None else origin
+    origin = np.array(origin, dtype=np.float64)
+    d = np.empty(len(position)) if out is None else out
+    for first, chunk in iter_chunks(position, chunksize):
+        d[first:first + len(chunk)] = np.linalg.norm(chunk - origin, axis=-1)
+    return d
+
+def path_length(position, chunksize=10**6):
+    """Total length of the path sum_i |r[i+1] - r[i]|.
+
+    Parameters
+    ----------
+    position : `nframes` x 3 array
+        positions (can be a memmap)
+    chunksize : int
+        number of frames processed at a time
+
+    Returns
+    -------
+    length : float
+    """
+    length = 0.
+    for first, chunk in iter_chunks(position, chunksize):
+        # include the last frame of the previous chunk
+        if first > 0:
+            chunk = position[first - 1:first + len(chunk)]
+        length += np.sum(np.linalg.norm(np.diff(chunk, axis=0), axis=-1))
+    return length
+
+def radius_of_gyration(position, chunksize=10**6):
+    """Radius of gyration of all frames, sqrt(<|r - <r>|^2>).
+
+    The mean and the sum of squared deviations are calculated for
+    each chunk and combined (Chan et al.'s parallel algorithm), which
+    avoids the loss of precision of <r^2> - <r>^2.
+
+    Parameters
+    ----------
+    position : `nframes` x 3 array
+        positions (can be a memmap)
+    chunksize : int
+        number of frames processed at a time
+
+    Returns
+    -------
+    rgyr : float
+    """
+    n = 0
+    mean = np.zeros(position.shape[-1])
+    M2 = 0.
+    for first, chunk in iter_chunks(position, chunksize):
+        nc = len(chunk)
+        chunk_mean = chunk.mean(axis=0)
+        chunk_M2 = np.sum((chunk - chunk_mean)**2)
+        delta = chunk_mean - mean
+        M2 += chunk_M2 + np.sum(delta**2) * n * nc / (n + nc)
+        mean += delta * nc / (n + nc)
+        n += nc
+    return np.sqrt(M2 / n)
+
+def window_average(position, window, chunksize=10**6, out=None):
+    """Averages over consecutive, non-overlapping windows of frames.
+
+    Parameters
+    ----------
+    position : array
+        `nframes` x 3 positions or any other array of per-frame values
+        (e.g., from :func:`displacement`)
+    window : int
+        number of frames per window; incomplete windows at the end are
+        dropped
+    chunksize : int
+        approximate number of frames processed at a time (rounded to a
+        multiple of `window`)
+    out : array, optional
+        array of length ``nframes // window`` for the result
+
+    Returns
+    -------
+    averages : array
+        ``nframes // window`` averages (each of shape ``position.shape[1:]``)
+    """
+    nwindows = len(position) // window
+    shape = (nwindows,) + position.shape[1:]
+    averages = np.empty(shape) if out is None else out
+    # whole windows per chunk
+    step = max(chunksize // window, 1)
+    for w in range(0, nwindows, step):
+        nw = min(step, nwindows - w)
+        chunk = position[w*window:(w + nw)*window]
+        averages[w:w + nw] = chunk.reshape((nw, window) + position.shape[1:]).mean(axis=1)
+    return averages
@@ -40,3 +40,210 @@ def sin_explicit(x, N=100):
         sumN += an
 
     return sumN
+
+
+# array versions
+#
+# The series are summed for a whole array of x at once. Each element
+# stops as soon as its terms are decreasing and smaller than eps times
+# its partial sum; only the elements that have not converged yet are
+# kept in the arrays for the next term.
+
+import numpy as np
+
+def _sum_series(x, N, eps, term):
+    """Sum the series for all elements of `x` with per-element early termination.
+
+    `term(n, x, a)` returns the n-th terms for the arguments `x` (the
+    elements that are still summed) given their previous terms `a`.
+    Returns the sums and the number of terms for each element.
+    """
+    x, N = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(N))
+    shape = x.shape
+    x, N = x.ravel(), N.ravel()
+
+    sums = x.copy()     # n=1
+    counts = np.ones(x.shape, dtype=int)
+
+    # elements that still need terms (sin(0) = 0 is done after n=1)
+    idx = np.flatnonzero((N > 1) & (x != 0))
+    xa, an, sa = x[idx], x[idx], sums[idx]
+    for n in range(2, N.max(initial=1) + 1):
+        if len(idx) == 0:
+            break
+        a_new = term(n, xa, an)
+        sa = sa + a_new
+        counts[idx] = n
+        done = ((n >= N[idx])
+                | ((np.abs(a_new) <= eps*np.abs(sa)) & (np.abs(a_new) < np.abs(an))))
+        an = a_new
+        if np.any(done):
+            sums[idx[done]] = sa[done]
+            keep = ~done
+            idx, xa, an, sa = idx[keep], xa[keep], an[keep], sa[keep]
+
+    return sums.reshape(shape)[()], counts.reshape(shape)[()]
+
+def sin_recursive_array(x, N=100, eps=np.finfo(np.float64).eps):
+    """Calculate sin(x) for an array of x with the recursive series.
+
+    Arguments
+    ---------
+    x : float or array
+        arguments of sin(x)
+    N : int or array
+        maximum number of terms; an array of N is broadcast against x,
+        e.g., ``x[:, np.newaxis]`` and ``N[np.newaxis, :]`` calculate
+        the series for all combinations of x and N in one call
+    eps : float
+        an element is converged when its terms decrease and the last
+        term is smaller than `eps` times the sum; with ``eps=0`` all N
+        terms are summed, as in :func:`sin_recursive`
+
+    Returns
+    -------
+    func_values, counts
+        sums of the series and the number of terms used for each x
+    """
+    def term(n, x, an):
+        qn = -x*x/((2*n - 1) * (2*n - 2))
+        return an * qn
+
+    return _sum_series(x, N, eps, term)
+
+def sin_explicit_array(x, N=100, eps=np.finfo(np.float64).eps):
+    """Calculate sin(x) for an array of x with the explicit series... BADLY
+
+    Same arguments and return values as :func:`sin_recursive_array`.
+    Powers and factorials are calculated in floating point for each
+    term so that they overflow for large n (giving inf or nan) instead
+    of raising an error.
+    """
+    def term(n, x, an):
+        factorial = np.prod(np.arange(1, 2*n, dtype=np.float64))
+        return (-1)**(n-1) * x**(2*n-1) / factorial
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        return _sum_series(x, N, eps, term)
+
+
+# series engine with cached coefficients and range reduction
+#
+# The coefficients (-1)^(n-1)/(2n-1)! are calculated once (exactly,
+# with integer factorials) and kept in a bounded LRU cache, so that
+# repeated calls do not recompute factorials. The argument is first
+# reduced to r = x - 2 pi k in [-pi, pi] and then folded into
+# [-pi/2, pi/2] with sin(pi - r) = sin(r). For |r| <= pi/2 the terms
+# decrease from the start and about a dozen terms give full double
+# precision, independent of the size of x (up to |x| = 2**53 pi, see
+# below).
+
+from functools import lru_cache
+
+# 2 pi = sum(_TWOPI) + 1.7e-34 (Cody-Waite): each part has at most 27
+# significant bits and k = k_hi + k_lo is split into two numbers with
+# at most 26 significant bits (_K_SPLIT), so that all products k*C are
+# exact for |k| < 2**52, i.e., |x| < 2**53 pi = 2.8e16. Then
+# x - k 2 pi is calculated with an absolute error of a few 1e-16.
+# Larger |x| (_X_MAX and beyond) are only reduced modulo the double
+# 2*math.pi with np.remainder: the result is bounded but, because of
+# the error of 2*math.pi, not sin(x).
+_TWOPI = (6.283185303211212, 3.968374295837407e-09, 2.28847548386543e-17,
+          6.578502757186083e-26)
+_K_SPLIT = 2.0**26
+_X_MAX = 2.0**53 * math.pi
+# pi = _PI_HI + _PI_LO
+_PI_HI = math.pi
+_PI_LO = 1.2246467991473532e-16
+
+@lru_cache(maxsize=32)
+def sin_coefficients(N):
+    """Coefficients (-1)**(n-1)/(2n-1)! of the sine series for n=1..N.
+
+    The tables are cached (least recently used N are dropped) and
+    returned as read-only arrays.
+    """
+    c = np.array([(-1)**(n-1) / math.factorial(2*n - 1) for n in range(1, N+1)])
+    c.flags.writeable = False
+    return c
+
+@lru_cache(maxsize=32)
+def sin_max_terms(eps=np.finfo(np.float64).eps):
+    """Number of terms so that the next term at |x| = pi/2 is below eps."""
+    n = 1
+    while (math.pi/2)**(2*n) * (1 / math.factorial(2*n + 1)) > eps:
+        n += 1
+    return n
+
+def reduce_argument(x):
+    """Return r in [-pi/2, pi/2] with sin(r) = sin(x).
+
+    x is reduced modulo 2 pi to [-pi, pi] and then folded with
+    sin(pi - r) = sin(r) and sin(-pi - r) = sin(r). The reduction is
+    accurate (absolute error of a few 1e-16) for |x| < 2**53 pi, about
+    2.8e16. Larger |x| still give r in [-pi/2, pi/2] but sin(r) is not
+    an approximation of sin(x) anymore; inf and nan give nan.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        x = np.where(np.abs(x) < _X_MAX, x, np.remainder(x, 2*math.pi))
+    k = np.round(x / (2*math.pi))
+    k_hi = np.trunc(k / _K_SPLIT) * _K_SPLIT
+    k_lo = k - k_hi
+    r = x
+    for C in _TWOPI:
+        r = (r - k_hi*C) - k_lo*C
+    # x/(2 pi) is rounded, so for large |x| k can be off by one
+    k = np.round(r / (2*math.pi))
+    for C in _TWOPI:
+        r = r - k*C
+    r = np.where(r > 0.5*math.pi, (_PI_HI - r) + _PI_LO, r)
+    r = np.where(r < -0.5*math.pi, (-_PI_HI - r) - _PI_LO, r)
+    assert not np.any(np.abs(r) > 0.5*math.pi), "argument reduction failed"
+    return r
+
+def sin_series(x, N=None, eps=np.finfo(np.float64).eps, reduce=True):
+    """Calculate sin(x) for an array of x with range reduction.
+
+    Arguments
+    ---------
+    x : float or array
+        arguments of sin(x)
+    N : int or array
+        maximum number of terms (an array is broadcast against x); the
+        default is the number needed for precision `eps` at
+        |x| = pi/2 (see :func:`sin_max_terms`)
+    eps : float
+        each element uses only as many terms as needed for a
+        truncation error below `eps` relative to the first term; with
+        ``eps=0``, N terms are used (fewer when the terms underflow)
+    reduce : bool
+        reduce x to [-pi/2, pi/2] (see :func:`reduce_argument`)
+
+    Returns
+    -------
+    func_values, counts
+        sums of the series and the number of terms used for each x
+    """
+    x = np.asarray(x, dtype=np.float64)
+    r = reduce_argument(x) if reduce else x
+    if N is None:
+        N = sin_max_terms(eps)
+    r, N = np.broadcast_arrays(r, np.asarray(N))
+    Nmax = int(N.max(initial=1))
+    c = sin_coefficients(Nmax)
+    r2 = r*r
+
+    # terms needed: stop at n when the next term |c[n] r^(2n)| <= eps
+    counts = N.astype(int)
+    power = np.ones_like(r)
+    for n in range(1, Nmax):
+        power = power * r2
+        small = (np.abs(c[n]) * power <= eps) & (counts == N) & (n < N)
+        counts[small] = n
+
+    # Horner scheme, each element starts at its own highest term
+    s = np.zeros_like(r)
+    for n in range(Nmax, 0, -1):
+        s = np.where(n <= counts, s*r2 + c[n-1], s)
+    return (r*s)[()], counts[()]
@@ -0,0 +1,226 @@
+# Parallel error analysis sweeps for the sine series
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# The relative error of the series implementations in series.py is
+# studied on grids of arguments x and numbers of terms N (see the
+# sine-series-erroranalysis notebooks). sweep() evaluates all cells
+# (method, x, N) of the grid:
+#
+#   - the cells are split into chunks that are evaluated in a pool of
+#     worker processes
+#   - each finished chunk is stored in a cache directory; when the
+#     sweep is repeated (e.g., with one more N value) only the cells
+#     that are not in the cache are calculated
+#   - the result is a "tidy" numpy structured array with one row per
+#     cell: method, x, N, value, relative error, number of terms, and
+#     time per evaluation
+#
+# Example:
+#
+#   import numpy as np, sweep
+#   x = np.pi*np.array([1/3, 2, 7.89, -12.3, 14.78])
+#   N = np.arange(1, 1000)
+#   data = sweep.sweep(x, N, methods=["recursive", "series"],
+#                      cache_dir="sweep_cache")
+#   rows = data[(data["method"] == "recursive") & (data["x"] == x[0])]
+#   plt.loglog(rows["N"], rows["relerror"])
+#
+# or from the command line
+#
+#   python sweep.py --x 1.047 6.283 --N 1 200 --methods recursive explicit -o sweep.csv
+
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import os
+import time
+
+import numpy as np
+
+import series
+
+# name: (function, array) -- array functions take arrays of x and N
+# and return values and term counts; they are called with eps=0 so
+# that all N terms are summed as in the scalar functions
+METHODS = {
+    "recursive": (series.sin_recursive, False),
+    "explicit": (series.sin_explicit, False),
+    "recursive_array": (series.sin_recursive_array, True),
+    "explicit_array": (series.sin_explicit_array, True),
+    "series": (series.sin_series, True),
+}
+
+DTYPE = np.dtype([("method", "U16"), ("x", "f8"), ("N", "i8"), ("value", "f8"),
+                  ("relerror", "f8"), ("terms", "i8"), ("time", "f8")])
+
+
+def evaluate(method, x, N):
+    """Evaluate `method` for all pairs ``(x[i], N[i])``.
+
+    Returns
+    -------
+    value, terms, time : arrays
+       value of the series, number of terms, and the time per
+       evaluation (for array methods, the time of the vectorized call
+       divided by the number of cells). A scalar function that raises
+       an error (e.g., an overflow in ``sin_explicit``) gives ``nan``.
+    """
+    func, array = METHODS[method]
+    x = np.asarray(x, dtype=np.float64)
+    N = np.asarray(N, dtype=np.int64)
+    if array:
+        start = time.perf_counter()
+        with np.errstate(all="ignore"):
+            value, terms = func(x, N=N, eps=0)
+        elapsed = time.perf_counter() - start
+        return (np.asarray(value, dtype=np.float64), np.asarray(terms, dtype=np.int64),
+                np.full(len(x), elapsed/max(len(x), 1)))
+
+    value = np.empty(len(x))
+    terms = np.empty(len(x), dtype=np.int64)
+    times = np.empty(len(x))
+    for i, (xi, Ni) in enumerate(zip(x, N)):
+        start = time.perf_counter()
+        try:
+            result = func(xi, N=int(Ni))
+        except (OverflowError, ZeroDivisionError):
+            result = np.nan
+        times[i] = time.perf_counter() - start
+        # the special case x == 0 returns (value, terms)
+        if isinstance(result, tuple):
+            value[i], terms[i] = result
+        else:
+            value[i], terms[i] = result, Ni
+    return value, terms, times
+
+
+def _chunk_filename(cache_dir, method, x, N):
+    """Cache file for a chunk, named by a hash of its parameters."""
+    digest = hashlib.sha1(method.encode() + x.tobytes() + N.tobytes()).hexdigest()
+    return os.path.join(cache_dir, "{0}-{1}.npz".format(method, digest[:16]))
+
+
+def load_cache(cache_dir, method):
+    """Return all cached cells of `method` as ``{(x, N): (value, terms, time)}``."""
+    cells = {}
+    for filename in glob.glob(os.path.join(cache_dir, method + "-*.npz")):
+        with np.load(filename) as data:
+            for row in zip(data["x"], data["N"], data["value"], data["terms"], data["time"]):
+                cells[(float(row[0]), int(row[1]))] = row[2:]
+    return cells
+
+
+def save_chunk(cache_dir, method, x, N, value, terms, times):
+    """Store the results of a chunk in `cache_dir`."""
+    filename = _chunk_filename(cache_dir, method, x, N)
+    tmp = filename + ".tmp.npz"
+    np.savez(tmp, x=x, N=N, value=value, terms=terms, time=times)
+    os.replace(tmp, filename)
+
+
+def sweep(x_values, N_values, methods=("recursive",), cache_dir=None, processes=None,
+          chunksize=1000, verbose=False):
+    """Evaluate the series for all combinations of methods, x and N.
+
+    Arguments
+    ---------
+    x_values : array
+        arguments x
+    N_values : array
+        numbers of terms N
+    methods : list
+        names of methods in :data:`METHODS`
+    cache_dir : str, optional
+        directory for cached results; cells that are already in the
+        cache are not calculated again
+    processes : int, optional
+        number of worker processes (default: number of CPUs); with
+        ``processes=1`` everything is calculated in this process
+    chunksize : int
+        number of cells per task for a worker
+    verbose : bool
+        print the number of cached and new cells
+
+    Returns
+    -------
+    data : numpy structured array
+        one row per cell with fields ``method, x, N, value, relerror,
+        terms, time`` (see :data:`DTYPE`), ordered by method, x, N
+    """
+    x_values = np.asarray(x_values, dtype=np.float64)
+    N_values = np.asarray(N_values, dtype=np.int64)
+    xx, NN = [a.ravel() for a in np.meshgrid(x_values, N_values, indexing="ij")]
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    tables = []
+    for method in methods:
+        if method not in METHODS:
+            raise ValueError("unknown method {0!r}, choose from {1}".format(
+                method, ", ".join(METHODS)))
+        cells = load_cache(cache_dir, method) if cache_dir is not None else {}
+        missing = np.array([(x, N) not in cells for x, N in zip(xx.tolist(), NN.tolist())],
+                           dtype=bool)
+        if verbose:
+            print("{0}: {1} cells cached, {2} to calculate".format(
+                method, len(xx) - np.sum(missing), np.sum(missing)))
+        chunks = [(xx[missing][i:i + chunksize], NN[missing][i:i + chunksize])
+                  for i in range(0, np.sum(missing), chunksize)]
+        for (x, N), result in zip(chunks, _map_chunks(method, chunks, processes)):
+            if cache_dir is not None:
+                save_chunk(cache_dir, method, x, N, *result)
+            for row in zip(x.tolist(), N.tolist(), *result):
+                cells[row[:2]] = row[2:]
+
+        table = np.zeros(len(xx), dtype=DTYPE)
+        table["method"] = method
+        table["x"] = xx
+        table["N"] = NN
+        rows = np.array([tuple(cells[(x, N)]) for x, N in zip(xx.tolist(), NN.tolist())],
+                        dtype=np.float64).reshape(-1, 3)
+        table["value"], table["terms"], table["time"] = rows.T
+        with np.errstate(divide="ignore", invalid="ignore"):
+            exact = np.sin(xx)
+            table["relerror"] = np.abs((table["value"] - exact)/exact)
+        tables.append(table)
+    return np.concatenate(tables) if tables else np.zeros(0, dtype=DTYPE)
+
+
+def _map_chunks(method, chunks, processes=None):
+    """Evaluate the chunks in a process pool (or serially for one process)."""
+    if processes == 1 or len(chunks) <= 1:
+        return [evaluate(method, x, N) for x, N in chunks]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(evaluate, method, x, N) for x, N in chunks]
+        return [future.result() for future in futures]
+
+
+def write_csv(data, filename):
+    """Write the structured array from :func:`sweep` as CSV."""
+    np.savetxt(filename, data, delimiter=",", header=",".join(data.dtype.names),
+               comments="", fmt=["%s", "%.17g", "%d", "%.17g", "%.17g", "%d", "%.6g"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Relative error of the sine series on a grid of x and N")
+    parser.add_argument("--x", type=float, nargs="+", default=[np.pi/3],
+                        help="arguments x")
+    parser.add_argument("--N", type=int, nargs=2, default=[1, 100], metavar=("NMIN", "NMAX"),
+                        help="range of numbers of terms (inclusive)")
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=["recursive"],
+                        help="series implementations")
+    parser.add_argument("--cache", default="sweep_cache",
+                        help="cache directory")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="number of worker processes")
+    parser.add_argument("-o", "--output", default="sweep.csv",
+                        help="CSV file for the results")
+    args = parser.parse_args()
+
+    data = sweep(args.x, np.arange(args.N[0], args.N[1] + 1), methods=args.methods,
+                 cache_dir=args.cache, processes=args.processes, verbose=True)
+    write_csv(data, args.output)
+    print("Wrote {0} rows to {1}".format(len(data), args.output))
@@ -0,0 +1,31 @@
+# Tests for the range reduction in series.py
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+#
+# Run with
+#
+#   python -m pytest test_series.py
+
+import math
+import warnings
+
+import numpy as np
+import pytest
+
+import series
+
+
+@pytest.mark.parametrize("magnitude", [1, 1e3, 1e10, 1e15, 2e16])
+def test_sin_series_accuracy(magnitude):
+    x = magnitude * np.random.default_rng(494).uniform(-1, 1, 10000)
+    assert np.max(np.abs(series.sin_series(x)[0] - np.sin(x))) < 5e-15
+
+
+@pytest.mark.parametrize("x", [1e20, 1e50, 1e300, -1e300])
+def test_sin_series_huge_arguments(x):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        r = series.reduce_argument(x)
+        value, terms = series.sin_series(x)
+    assert abs(r) <= math.pi/2
+    assert abs(value) <= 1
@@ -0,0 +1,152 @@
+# Barnes-Hut tree code for gravitational forces between many bodies
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# The all-pairs forces (F_gravity_nbody in integrators2.py) cost
+# O(N^2). The Barnes-Hut algorithm puts the bodies into a tree of
+# boxes (quadtree in 2D, octree in 3D, 2^d children in d dimensions).
+# A box of size s at distance D from a body is treated as a single
+# body at its center of mass when s/D < theta, so only O(log N) boxes
+# are needed for each body and the total cost is O(N log N).
+#
+# The tree is walked for all bodies at once: each box is visited
+# once with the array of all bodies that still need to look at it,
+# so the Python loop is over the O(N) boxes and not over bodies.
+#
+# F_gravity_barneshut(r, m=..., theta=...) has the same call signature
+# and returns forces in the same N x d layout as the force functions
+# in integrators2.py and can be used with integrate_newton_2d().
+
+import numpy as np
+
+# constant of gravity when using AU for length, solar mass for
+# mass, and years for time (and the same default mass as in
+# integrators2.py)
+G_gravity = 4*np.pi**2
+M_earth = 3.003467e-6
+
+
+class Node:
+    """Box in the Barnes-Hut tree."""
+
+    def __init__(self, indices, r, m, center, size):
+        #: indices of the bodies in the box
+        self.indices = indices
+        #: center and edge length of the box
+        self.center = center
+        self.size = size
+        #: total mass and center of mass of the bodies in the box
+        self.mass = np.sum(m[indices])
+        self.com = np.sum(m[indices, np.newaxis] * r[indices], axis=0) / self.mass
+        #: sub-boxes (empty for a leaf)
+        self.children = []
+
+
+def build_tree(r, m, leafsize=8, maxdepth=64):
+    """Build the Barnes-Hut tree for bodies at positions `r`.
+
+    Parameters
+    ----------
+    r : array
+      N x d array of positions
+    m : array
+      N masses
+    leafsize : int
+      boxes with at most `leafsize` bodies are not divided further
+    maxdepth : int
+      maximum number of levels (limits the depth for bodies at the
+      same position)
+
+    Returns
+    -------
+    root : Node
+       box containing all bodies
+    """
+    rmin, rmax = r.min(axis=0), r.max(axis=0)
+    root = Node(np.arange(len(r)), r, m, 0.5*(rmin + rmax), np.max(rmax - rmin))
+
+    dim = r.shape[1]
+    # offsets of the 2^d sub-boxes from the center in units of size/4
+    octants = np.array([[1 if (k >> i) & 1 else -1 for i in range(dim)]
+                        for k in range(2**dim)])
+    # weights to turn the "above center" booleans into an octant number
+    bits = 2**np.arange(dim)
+
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if len(node.indices) <= leafsize or depth >= maxdepth:
+            continue
+        octant = (r[node.indices] > node.center) @ bits
+        for k in np.unique(octant):
+            child = Node(node.indices[octant == k], r, m,
+                         node.center + 0.25*node.size*octants[k], 0.5*node.size)
+            node.children.append(child)
+            stack.append((child, depth + 1))
+    return root
+
+
+def F_gravity_barneshut(r, m=M_earth, theta=0.5, leafsize=8, epsilon=0, **kwargs):
+    """Gravitational forces on N bodies with the Barnes-Hut algorithm.
+
+    Parameters
+    ----------
+    r : array
+      N x d array of positions (d=2 or 3, or any other d)
+    m : float or array
+      mass of all bodies or array of N masses
+    theta : float
+      opening angle: a box of size s at distance D is approximated by
+      its center of mass if s/D < theta. ``theta=0`` calculates all
+      pair forces exactly; typical values are 0.3 to 1.
+    leafsize : int
+      maximum number of bodies in a box that is not divided further;
+      forces from bodies in leaf boxes are calculated directly
+    epsilon : float
+      softening length (the pair force uses |r|^2 + epsilon^2)
+
+    Returns
+    -------
+    F : array
+       N x d array of forces
+    """
+    # float32 positions give float32 forces; anything else float64
+    r = np.asarray(r)
+    r = np.asarray(r, dtype=np.result_type(r.dtype, np.float32))
+    N = len(r)
+    m = np.broadcast_to(np.ravel(m), (N,)).astype(r.dtype)
+    eps2 = epsilon**2
+
+    F = np.zeros_like(r)
+    root = build_tree(r, m, leafsize=leafsize)
+
+    # each box with the bodies that still need forces from it
+    stack = [(root, np.arange(N))]
+    while stack:
+        node, bodies = stack.pop()
+        if not node.children:
+            # leaf: direct sum over all pairs (bodies, node.indices)
+            rij = r[bodies, np.newaxis, :] - r[np.newaxis, node.indices, :]
+            d2 = np.sum(rij**2, axis=-1) + eps2
+            # remove self-interaction
+            d2[bodies[:, np.newaxis] == node.indices[np.newaxis, :]] = np.inf
+            mj = m[node.indices]
+            F[bodies] -= np.sum((mj / d2**1.5)[:, :, np.newaxis] * rij, axis=1)
+            continue
+
+        dr = r[bodies] - node.com
+        d2 = np.sum(dr**2, axis=-1)
+        # a box that contains the body itself is always opened
+        inside = np.all(np.abs(r[bodies] - node.center) <= 0.5*node.size, axis=-1)
+        far = (node.size**2 < theta**2 * d2) & ~inside
+        if np.any(far):
+            # whole box acts as a single body at its center of mass
+            d2far = d2[far] + eps2
+            F[bodies[far]] -= (node.mass / d2far**1.5)[:, np.newaxis] * dr[far]
+        near = bodies[~far]
+        if len(near):
+            for child in node.children:
+                stack.append((child, near))
+
+    F *= G_gravity * m[:, np.newaxis]
+    return F
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Import-time benchmark for the integrator modules of lesson 10 ODEs
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# The numerical code in the integrator modules should only need numpy
+# so that importing it is fast (e.g., in the workers of a process
+# pool); matplotlib is only imported when a plotting function such as
+# analyze_energies() is called.
+#
+# Each module is imported in a fresh Python process. The script prints
+# the import time (best of several repeats) and fails (exit code 1) if
+# importing a module also imports matplotlib.
+#
+# Usage:
+#
+#   python benchmark_import.py
+#   python benchmark_import.py --repeat 10 integrators2_solution
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ["integrators", "integrators_solution",
+           "integrators2", "integrators2_solution"]
+
+# measure the import in a fresh interpreter and report which heavy
+# packages were loaded
+_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed,
+                  "matplotlib": "matplotlib" in sys.modules,
+                  "numpy": "numpy" in sys.modules}}))
+"""
+
+# time for "import numpy" alone, for comparison
+_NUMPY = _CODE.format(module="numpy")
+
+
+def measure(code, repeat=5):
+    """Run `code` `repeat` times in new processes and return the fastest result."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd=directory,
+                                check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output))
+    return min(results, key=lambda r: r["time"])
+
+
+def benchmark(modules=MODULES, repeat=5):
+    """Return the import time and the loaded packages for each module."""
+    results = {"numpy": measure(_NUMPY, repeat=repeat)}
+    for module in modules:
+        results[module] = measure(_CODE.format(module=module), repeat=repeat)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import-time benchmark for the integrator modules")
+    parser.add_argument("modules", nargs="*", default=MODULES,
+                        help="modules to import")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of imports per module (best is reported)")
+    args = parser.parse_args()
+
+    results = benchmark(args.modules, repeat=args.repeat)
+    failed = False
+    for module, r in results.items():
+        print("{0:24s} {1:8.1f} ms   matplotlib imported: {2}".format(
+            module, 1000*r["time"], r["matplotlib"]))
+        failed = failed or r["matplotlib"]
+    if failed:
+        print("FAILED: matplotlib must not be imported by the numerical code")
+        raise SystemExit(1)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# Work-precision benchmarks for the integrators of lesson 10 ODEs
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# Runs integrate_newton (1D: harmonic, anharmonic, power law) and
+# integrate_newton_2d (2D: gravity) for all integrators over a range
+# of time steps h and records for each run
+#
+#   - wall time
+#   - number of force evaluations
+#   - steps per second
+#   - energy conservation error (energy_conservation())
+#
+# The results are written as JSON (or CSV) and can be plotted as
+# work-precision curves (force evaluations vs energy error), which
+# show which integrator and step size give a required precision at
+# the smallest cost. Compare against an older results file with
+# --compare to catch performance regressions.
+#
+# Usage:
+#
+#   python benchmark_integrators.py --quick -o results.json --plot wp.png
+#   python benchmark_integrators.py -o new.json --compare results.json
+
+import argparse
+import csv
+import json
+import time
+
+import numpy as np
+
+import integrators_solution as integrators
+import integrators2_solution as integrators2
+
+
+def counted(force):
+    """Wrap `force` so that the number of calls is recorded in `.calls`"""
+    def F(*args, **kwargs):
+        F.calls += 1
+        return force(*args, **kwargs)
+    F.calls = 0
+    return F
+
+
+# Test problems: driver, force and potential energy, initial
+# conditions, run length, and the time steps to test.
+PROBLEMS = {
+    "harmonic": dict(
+        module=integrators, driver="integrate_newton",
+        force=integrators.F_harmonic, U=integrators.U_harmonic,
+        kwargs=dict(x0=0, v0=1), t_max=100,
+        h_values=[0.1, 0.03, 0.01, 0.003, 0.001]),
+    "anharmonic": dict(
+        module=integrators, driver="integrate_newton",
+        force=integrators.F_anharmonic, U=integrators.U_anharmonic,
+        kwargs=dict(x0=0, v0=0.5), t_max=100,
+        h_values=[0.1, 0.03, 0.01, 0.003, 0.001]),
+    "power": dict(
+        module=integrators, driver="integrate_newton",
+        force=integrators.F_power, U=integrators.U_power,
+        kwargs=dict(x0=1, v0=0), t_max=100,
+        h_values=[0.03, 0.01, 0.003, 0.001]),
+    "gravity": dict(
+        module=integrators2, driver="integrate_newton_2d",
+        force=integrators2.F_gravity, U=integrators2.U_gravity,
+        kwargs=dict(x0=np.array([1, 0]), v0=np.array([0, 2*np.pi]),
+                    mass=integrators2.M_earth, m=integrators2.M_earth),
+        t_max=10,
+        h_values=[0.01, 0.003, 0.001, 0.0003, 0.0001]),
+}
+
+INTEGRATORS = ["euler", "rk2", "rk4", "velocity_verlet", "velocity_verlet_fsal"]
+
+
+def run(problem, integrator, h, t_max=None):
+    """Integrate `problem` with `integrator` and step `h` and measure cost.
+
+    Parameters
+    ----------
+    problem : str
+       name of the problem in :data:`PROBLEMS`
+    integrator : str
+       name of the integrator in the problem's module;
+       ``velocity_verlet_fsal`` is created with a call
+    h : float
+       time step
+    t_max : float, optional
+       override the problem's run length
+
+    Returns
+    -------
+    result : dict
+       problem, integrator, h, steps, wall time, force evaluations,
+       steps per second, and energy conservation error
+    """
+    p = PROBLEMS[problem]
+    module = p["module"]
+    t_max = p["t_max"] if t_max is None else t_max
+    integrate = getattr(module, p["driver"])
+    I = getattr(module, integrator)
+    if integrator.endswith("_fsal"):
+        I = I()
+    force = counted(p["force"])
+    kwargs = dict(p["kwargs"])
+    # only passed to the potential energy (2D); the driver passes it
+    # on to the force function
+    U_kwargs = {"m": kwargs["m"]} if "m" in kwargs else {}
+
+    with np.errstate(all="ignore"):
+        start = time.perf_counter()
+        t, y = integrate(t_max=t_max, h=h, force=force, integrator=I, **kwargs)
+        walltime = time.perf_counter() - start
+        error = module.energy_conservation(t, y, p["U"], **U_kwargs)
+
+    nsteps = len(t) - 1
+    return {"problem": problem, "integrator": integrator, "h": h,
+            "t_max": t_max, "steps": nsteps, "walltime": walltime,
+            "force_evaluations": force.calls,
+            "steps_per_second": nsteps/walltime if walltime > 0 else float("inf"),
+            "energy_error": float(error)}
+
+
+def benchmark(problems=None, integrators=None, quick=False, verbose=True):
+    """Run all combinations of problems, integrators and time steps.
+
+    With `quick`, the run lengths are reduced 10-fold and only the
+    three largest time steps are used.
+    """
+    problems = list(PROBLEMS) if problems is None else problems
+    integrators = INTEGRATORS if integrators is None else integrators
+    results = []
+    for problem in problems:
+        p = PROBLEMS[problem]
+        h_values = p["h_values"][:3] if quick else p["h_values"]
+        t_max = p["t_max"]/10 if quick else p["t_max"]
+        for integrator in integrators:
+            for h in h_values:
+                r = run(problem, integrator, h, t_max=t_max)
+                if verbose:
+                    print("{problem:12s} {integrator:22s} h={h:<8g} "
+                          "{walltime:8.3f} s {force_evaluations:9d} F "
+                          "{steps_per_second:10.0f} steps/s  "
+                          "error={energy_error:.3g}".format(**r))
+                results.append(r)
+    return results
+
+
+def write_results(results, filename):
+    """Write results as JSON or, if `filename` ends in .csv, as CSV."""
+    if filename.endswith(".csv"):
+        with open(filename, "w", newline="") as out:
+            writer = csv.DictWriter(out, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(filename, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+def compare(results, reference, tolerance=0.2):
+    """Compare steps per second with a reference run.
+
+    Returns the list of ``(problem, integrator, h, ratio)`` for all
+    runs that are more than `tolerance` (fraction) slower than the
+    same run in `reference` (list of results, e.g., loaded from JSON).
+    """
+    ref = {(r["problem"], r["integrator"], r["h"]): r for r in reference}
+    slower = []
+    for r in results:
+        key = (r["problem"], r["integrator"], r["h"])
+        if key not in ref:
+            continue
+        ratio = r["steps_per_second"] / ref[key]["steps_per_second"]
+        if ratio < 1 - tolerance:
+            slower.append(key + (ratio,))
+    return slower
+
+
+def plot_work_precision(results, filename=None):
+    """Plot force evaluations vs energy error for each problem."""
+    import matplotlib.pyplot as plt
+
+    problems = sorted(set(r["problem"] for r in results))
+    fig, axes = plt.subplots(1, len(problems), figsize=(4*len(problems), 3.5),
+                             squeeze=False)
+    for ax, problem in zip(axes[0], problems):
+        for integrator in INTEGRATORS:
+            rows = [r for r in results
+                    if r["problem"] == problem and r["integrator"] == integrator]
+            if not rows:
+                continue
+            ax.loglog([r["force_evaluations"] for r in rows],
+                      [r["energy_error"] for r in rows], 'o-', label=integrator)
+        ax.set_title(problem)
+        ax.set_xlabel("force evaluations")
+        ax.set_ylabel("energy error")
+    axes[0][0].legend(loc="best", fontsize="small")
+    fig.tight_layout()
+    if filename:
+        fig.savefig(filename)
+    return fig
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Work-precision benchmarks for the ODE integrators")
+    parser.add_argument("-o", "--output", default="benchmark_integrators.json",
+                        help="results file (.json or .csv)")
+    parser.add_argument("--problems", nargs="+", choices=list(PROBLEMS),
+                        help="only run these problems")
+    parser.add_argument("--integrators", nargs="+", choices=INTEGRATORS,
+                        help="only use these integrators")
+    parser.add_argument("--quick", action="store_true",
+                        help="shorter runs with fewer time steps")
+    parser.add_argument("--plot", metavar="FILE",
+                        help="save work-precision curves to FILE")
+    parser.add_argument("--compare", metavar="JSON",
+                        help="report runs that are slower than in JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed fractional slow-down for --compare")
+    args = parser.parse_args()
+
+    results = benchmark(problems=args.problems, integrators=args.integrators,
+                        quick=args.quick)
+    write_results(results, args.output)
+    print("Wrote results to {}".format(args.output))
+    if args.plot:
+        plot_work_precision(results, args.plot)
+        print("Wrote work-precision curves to {}".format(args.plot))
+    if args.compare:
+        with open(args.compare) as inp:
+            reference = json.load(inp)
+        slower = compare(results, reference, tolerance=args.tolerance)
+        for problem, integrator, h, ratio in slower:
+            print("SLOWER: {} {} h={:g}: {:.2f} x reference speed".format(
+                problem, integrator, h, ratio))
+        if slower:
+            raise SystemExit(1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# Speed vs accuracy of single precision for large ensembles
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# Integrates an ensemble of N planets on slightly different orbits
+# around the sun with integrate_newton_2d(..., dtype=...) in double
+# (float64) and single (float32) precision and records for each run
+#
+#   - wall time and speed-up of float32 relative to float64
+#   - memory of the trajectory
+#   - energy conservation error (energy_conservation(), always
+#     evaluated in float64), averaged over a sample of particles
+#
+# For small time steps the truncation error of the integrator becomes
+# smaller than the rounding error of float32 (about 1e-7) and single
+# precision no longer gives the accuracy of double precision.
+#
+# Usage:
+#
+#   python benchmark_precision.py --particles 10000 --t_max 1
+#   python benchmark_precision.py -o precision.json
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import integrators2_solution as integrators2
+
+INTEGRATORS = ["velocity_verlet_inplace", "rk4_inplace", "rk4"]
+DTYPES = {"float64": np.float64, "float32": np.float32}
+
+
+def ensemble(N, seed=4948):
+    """Initial positions and velocities (N x 2) of N near-circular orbits."""
+    rng = np.random.default_rng(seed)
+    x0 = np.zeros((N, 2))
+    x0[:, 0] = rng.uniform(0.8, 1.2, N)
+    v0 = np.zeros((N, 2))
+    # circular speed 2 pi / sqrt(r) AU/year, perturbed by up to 5%
+    v0[:, 1] = 2*np.pi/np.sqrt(x0[:, 0]) * rng.uniform(0.95, 1.05, N)
+    return x0, v0
+
+
+def energy_error(t, y, nsample=20):
+    """Mean energy conservation error of `nsample` particles of the ensemble."""
+    sample = np.linspace(0, y.shape[2] - 1, min(nsample, y.shape[2])).astype(int)
+    return np.mean([integrators2.energy_conservation(t, y[:, :, j], integrators2.U_gravity,
+                                                     m=integrators2.M_earth)
+                    for j in sample])
+
+
+def run(integrator, dtype, N=1000, t_max=1, h=0.001, record_every=10):
+    """Integrate the ensemble and measure wall time and energy error.
+
+    Returns
+    -------
+    result : dict
+       integrator, dtype, N, h, wall time, trajectory size in bytes,
+       energy conservation error
+    """
+    x0, v0 = ensemble(N)
+    I = getattr(integrators2, integrator)
+    inplace = integrator.endswith("_inplace")
+    if inplace:
+        I = I()
+    start = time.perf_counter()
+    t, y = integrators2.integrate_newton_2d(x0=x0, v0=v0, t_max=t_max, h=h,
+                                            mass=integrators2.M_earth,
+                                            force=integrators2.F_gravity,
+                                            integrator=I, inplace=inplace,
+                                            record_every=record_every,
+                                            dtype=DTYPES[dtype])
+    walltime = time.perf_counter() - start
+    return {"integrator": integrator, "dtype": dtype, "N": N, "h": h,
+            "t_max": t_max, "walltime": walltime, "nbytes": y.nbytes,
+            "energy_error": float(energy_error(t, y))}
+
+
+def benchmark(integrators=None, h_values=(0.01, 0.001), verbose=True, **kwargs):
+    """Run all integrators and time steps in float64 and float32.
+
+    Returns the list of results; each float32 result contains the
+    ``speedup`` and ``error_ratio`` relative to float64.
+    """
+    integrators = INTEGRATORS if integrators is None else integrators
+    results = []
+    for integrator in integrators:
+        for h in h_values:
+            ref = run(integrator, "float64", h=h, **kwargs)
+            single = run(integrator, "float32", h=h, **kwargs)
+            single["speedup"] = ref["walltime"] / single["walltime"]
+            single["error_ratio"] = single["energy_error"] / ref["energy_error"]
+            if verbose:
+                for r in ref, single:
+                    print("{integrator:24s} {dtype:8s} h={h:<8g} {walltime:8.3f} s "
+                          "{nbytes:12d} B  error={energy_error:.3g}".format(**r))
+                print("{0:24s} float32: {1:.2f} x faster, {2:.3g} x error".format(
+                    "", single["speedup"], single["error_ratio"]))
+            results.extend([ref, single])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Speed and accuracy of float32 vs float64 ensemble integration")
+    parser.add_argument("-N", "--particles", type=int, default=1000,
+                        help="number of particles in the ensemble")
+    parser.add_argument("--t_max", type=float, default=1,
+                        help="length of the run in years")
+    parser.add_argument("--h", type=float, nargs="+", default=[0.01, 0.001],
+                        help="time steps")
+    parser.add_argument("--integrators", nargs="+", choices=INTEGRATORS,
+                        help="only use these integrators")
+    parser.add_argument("-o", "--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = benchmark(integrators=args.integrators, h_values=args.h,
+                        N=args.particles, t_max=args.t_max)
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+        print("Wrote results to {}".format(args.output))
@@ -6,10 +6,14 @@
 # (very similar to integrators.py but includes a few more numpy
 # tricks to make higher dimensional positions/velocities work)
 
+import os
+import time
+
 import numpy as np
 import numpy.linalg
 
-import matplotlib.pyplot as plt
+# matplotlib is only imported by the plotting function
+# analyze_energies() so that the numerical code only needs numpy.
 
 #------------------------------------------------------------
 # force and potential energy functions
@@ -26,6 +30,12 @@ import matplotlib.pyplot as plt
 # The functions can take lists/arrays of n-dimensional vectors
 # and will produce equivalent arrays of force vectors or
 # n-dim arrays containing energies
+#
+# The forces are calculated in the precision of the positions: for
+# float32 positions (integrate_newton_2d(..., dtype=np.float32)) the
+# forces are also float32. Constants must therefore be plain Python
+# floats (or float32) so that they do not convert the result to
+# float64.
 
 
 # central forces
@@ -45,6 +55,9 @@ def unitvector(r):
        lengths of all the vectors as a Nx1 array
     rhat : array
        unit vectors in a Nxd array
+
+    Both arrays have the same floating point type as `r` (float32 or
+    float64).
     """
     rr = numpy.linalg.norm(r, axis=-1, keepdims=True)
     rhat = r/rr
@@ -65,6 +78,15 @@ def U_gravity(r, m=M_earth, M=M_sun, **kwargs):
     rr, rhat = unitvector(r)
     return np.ravel( -G_gravity*m*M/rr )
 
+def FU_gravity(r, m=M_earth, M=M_sun, **kwargs):
+    """Gravitational force and potential energy from one unitvector() call.
+
+    Returns ``F, U``, the same as ``F_gravity(r), U_gravity(r)``.
+    """
+    rr, rhat = unitvector(r)
+    F = -G_gravity*m*M/rr**2 * rhat
+    return F, np.ravel( -G_gravity*m*M/rr )
+
 def F_harmonic(r, k=1, **kwargs):
     """Harmonic force"""
     return -k*r
@@ -82,7 +104,125 @@ def F_power(r, k=1, p=6, **kwargs):
 def U_power(r, k=1, p=6, **kwargs):
     """Even-power potential U(x) = k/p x**p"""
     rr, rhat = unitvector(r)
-    return np.ravel( k/p * r**p )
+    return np.ravel( k/p * rr**p )
+
+def FU_power(r, k=1, p=6, **kwargs):
+    """Force and potential energy for k/p x^p from one unitvector() call.
+
+    Returns ``F, U``, the same as ``F_power(r), U_power(r)``.
+    """
+    rr, rhat = unitvector(r)
+    return -k * rr**(p-1) * rhat, np.ravel( k/p * rr**p )
+
+# Fused kernels FU(r) that return force and potential energy together
+# for a pair (force, potential). Both need the distances |r|, which
+# are then only calculated once. integrate_newton_2d() uses them when
+# an EnergyDrift monitor tracks the energy during the run.
+FUSED_KERNELS = {
+    (F_gravity, U_gravity): FU_gravity,
+    (F_power, U_power): FU_power,
+}
+
+# N-body gravity
+#
+# Forces between all pairs of N bodies with positions r (N x d) and
+# masses m (N). All N x N pairs are handled at once with numpy
+# broadcasting: the displacements r_i - r_j form a N x N x d array
+# and the pair forces are simply F_gravity(r_i - r_j, m_i, m_j). The
+# self-interaction (i == j) is removed by setting its mass to zero.
+# With `blocksize` only `blocksize` x N x d arrays are created at a
+# time, which limits the memory for large N.
+
+def _pairs(r, m, start, stop):
+    """Displacements r_i - r_j and masses for bodies i in [start, stop)
+
+    Returns ``rij, mi, mj`` (with shapes B x N x d, B x 1 x 1,
+    B x N x 1 for B = stop - start bodies) so that the self term i == j
+    is masked (dummy displacement and zero mass).
+    """
+    rij = r[start:stop, np.newaxis, :] - r[np.newaxis, :, :]
+    mj = np.repeat(m[np.newaxis, :], stop - start, axis=0)
+    self_pairs = np.arange(stop - start), np.arange(start, stop)
+    rij[self_pairs] = 1
+    mj[self_pairs] = 0
+    return rij, m[start:stop, np.newaxis, np.newaxis], mj[:, :, np.newaxis]
+
+def F_gravity_nbody(r, m=M_earth, blocksize=None, **kwargs):
+    """Gravitational forces on N bodies from all other bodies.
+
+    Parameters
+    ----------
+    r : array
+      N x d array of positions
+    m : float or array
+      mass of all bodies or array of N masses
+    blocksize : int, optional
+      Calculate the forces on `blocksize` bodies at a time to limit
+      memory usage; the default is to do all N at once.
+
+    Returns
+    -------
+    F : array
+       N x d array of forces
+
+    Example
+    -------
+    Integrate N bodies with initial positions `x0` and velocities
+    `v0` (both N x d) and masses `masses`::
+
+       t, y = integrate_newton_2d(x0=x0, v0=v0, mass=masses, m=masses,
+                                  force=F_gravity_nbody,
+                                  integrator=velocity_verlet_fsal())
+       E = energy_nbody(y, m=masses)
+
+    """
+    # float32 positions give float32 forces; anything else float64
+    r = np.asarray(r)
+    r = np.asarray(r, dtype=np.result_type(r.dtype, np.float32))
+    N = len(r)
+    m = np.broadcast_to(np.ravel(m), (N,)).astype(r.dtype)
+    blocksize = N if blocksize is None else blocksize
+
+    F = np.zeros_like(r)
+    for start in range(0, N, blocksize):
+        stop = min(start + blocksize, N)
+        rij, mi, mj = _pairs(r, m, start, stop)
+        F[start:stop] = np.sum(F_gravity(rij, m=mi, M=mj), axis=1)
+    return F
+
+def U_gravity_nbody(r, m=M_earth, blocksize=None, **kwargs):
+    """Total gravitational potential energy of N bodies.
+
+    Parameters
+    ----------
+    r : array
+      N x d array of positions or (nframes, N, d) array for a
+      trajectory
+    m : float or array
+      mass of all bodies or array of N masses
+    blocksize : int, optional
+      Calculate the energy for `blocksize` bodies at a time to limit
+      memory usage; the default is to do all N at once.
+
+    Returns
+    -------
+    U : float or array
+       potential energy (for each frame)
+    """
+    r = np.asarray(r, dtype=np.float64)
+    if r.ndim == 3:
+        return np.array([U_gravity_nbody(ri, m=m, blocksize=blocksize) for ri in r])
+    N = len(r)
+    m = np.broadcast_to(np.ravel(m), (N,))
+    blocksize = N if blocksize is None else blocksize
+
+    U = 0
+    for start in range(0, N, blocksize):
+        stop = min(start + blocksize, N)
+        rij, mi, mj = _pairs(r, m, start, stop)
+        U += np.sum(U_gravity(rij, m=mi, M=mj))
+    # every pair was counted twice
+    return 0.5*U
 
 #------------------------------------------------------------
 # integrators
@@ -122,7 +262,7 @@ def velocity_verlet(y, f, t, h):
     For comparing different algorithms it is ok to use this
     implementation for convenience. For production level code you
     should use a better implementation that saves the second force
-    evaluation.
+    evaluation such as the one created by :func:`velocity_verlet_fsal`.
 
     """
     # half step velocity
@@ -137,6 +277,378 @@ def velocity_verlet(y, f, t, h):
 
     return y
 
+def velocity_verlet_fsal():
+    """Create a velocity Verlet integrator that remembers the last force.
+
+    The force calculated at the end of a step (at the new positions)
+    is the same force that is needed at the beginning of the next
+    step. The integrator returned by this function keeps it around
+    and re-uses it so that velocity Verlet only needs *one* force
+    evaluation per step ("first same as last", FSAL) instead of the
+    two in :func:`velocity_verlet`.
+
+    The stored force is only used when the positions passed in are
+    identical to the positions at the end of the previous step and
+    the ODE function `f` is the same object; otherwise the force is
+    recalculated, so the integrator can be re-used for a different
+    trajectory. (A function `f` whose parameters were changed in place
+    is not detected; use a new integrator in that case.)
+
+    Returns
+    -------
+    integrator : function `I(y, f, t, h)`
+       velocity Verlet integrator with the same call signature as
+       :func:`velocity_verlet`
+
+    Example
+    -------
+    Use a new integrator for each trajectory::
+
+       t, y = integrate_newton_2d(..., integrator=velocity_verlet_fsal())
+
+    """
+    # state carried over between steps: positions and force at t+h and
+    # the ODE function that calculated the force
+    last = {'x': None, 'F': None, 'f': None}
+
+    def integrator(y, f, t, h):
+        if last['f'] is f and np.array_equal(y[0], last['x']):
+            F = last['F']
+        else:
+            F = f(t, y)
+        # half step velocity
+        y[1] += 0.5*h * F[1]
+        # full step position
+        y[0] += h*y[1]
+        # full step velocity (updated positions!); remember the force
+        # for the next step
+        F = f(t+h, y)
+        y[1] += 0.5*h * F[1]
+
+        last['x'] = np.copy(y[0])
+        last['F'] = F
+        last['f'] = f
+        return y
+
+    return integrator
+
+# Higher order symplectic integrators
+#
+# A velocity Verlet step of length h is time-reversible and symplectic
+# and so is a sequence of velocity Verlet steps of lengths w1*h, w2*h,
+# ... with w1 + w2 + ... = 1. For special (symmetric) choices of the
+# weights w the errors of the substeps cancel to higher order
+# (Yoshida 1990). Each substep needs one force evaluation because the
+# force at the end of a substep is re-used at the beginning of the
+# next one (and of the next step, as in velocity_verlet_fsal()).
+
+# 4th order (also known as the Forest-Ruth integrator)
+YOSHIDA4_WEIGHTS = (1/(2 - 2**(1/3)),
+                    -2**(1/3)/(2 - 2**(1/3)),
+                    1/(2 - 2**(1/3)))
+
+# 6th order (Yoshida 1990, solution A)
+_w1, _w2, _w3 = -1.17767998417887, 0.235573213359357, 0.784513610477560
+YOSHIDA6_WEIGHTS = (_w3, _w2, _w1, 1 - 2*(_w1 + _w2 + _w3), _w1, _w2, _w3)
+
+def symplectic_composition(weights):
+    """Create an integrator from velocity Verlet substeps of length w*h.
+
+    Arguments
+    ---------
+    weights : sequence
+       relative lengths of the velocity Verlet substeps; they must
+       add up to 1
+
+    Returns
+    -------
+    integrator : function `I(y, f, t, h)`
+       integrator that takes ``len(weights)`` force evaluations per
+       step; the weights are available as ``integrator.weights``
+    """
+    assert np.isclose(np.sum(weights), 1)
+    # state carried over between steps: positions and force at t+h and
+    # the ODE function that calculated the force
+    last = {'x': None, 'F': None, 'f': None}
+
+    def integrator(y, f, t, h):
+        if last['f'] is f and np.array_equal(y[0], last['x']):
+            F = last['F']
+        else:
+            F = f(t, y)
+        for w in weights:
+            # velocity Verlet substep of length w*h
+            y[1] += 0.5*w*h * F[1]
+            y[0] += w*h * y[1]
+            t += w*h
+            F = f(t, y)
+            y[1] += 0.5*w*h * F[1]
+
+        last['x'] = np.copy(y[0])
+        last['F'] = F
+        last['f'] = f
+        return y
+
+    # distinguishes compositions (e.g., yoshida4() and yoshida6()) in checkpoints
+    integrator.weights = np.array(weights, dtype=np.float64)
+    return integrator
+
+def yoshida4():
+    """Create a 4th order symplectic (Yoshida/Forest-Ruth) integrator `I(y, f, t, h)`.
+
+    Three force evaluations per step.
+    """
+    return symplectic_composition(YOSHIDA4_WEIGHTS)
+
+def yoshida6():
+    """Create a 6th order symplectic (Yoshida) integrator `I(y, f, t, h)`.
+
+    Seven force evaluations per step.
+    """
+    return symplectic_composition(YOSHIDA6_WEIGHTS)
+
+#------------------------------------------------------------
+# in-place integrators
+#
+# In-place integrators take as arguments y, f, t, h, out and write
+# y at time t+h into the array `out` (which must be a different array
+# than y). f is a function f(t, y, out) that must write the ODE force
+# vector into `out`. No new arrays are created during a step: all
+# intermediate stages are stored in scratch buffers that are allocated
+# once when the integrator is first used. Create the integrators with
+# the *_inplace() functions and use them with ``inplace=True`` in the
+# integration driver.
+
+def _buffers(work, y, n):
+    """Return `n` scratch arrays shaped like `y` (allocated only once)."""
+    buffers = work.get('buffers')
+    if buffers is None or buffers[0].shape != y.shape or buffers[0].dtype != y.dtype:
+        # new buffers invalidate any other state stored in work
+        work.clear()
+        buffers = work['buffers'] = [np.empty_like(y) for i in range(n)]
+    return buffers
+
+def euler_inplace():
+    """Create an in-place Euler integrator `I(y, f, t, h, out)`."""
+    def integrator(y, f, t, h, out):
+        f(t, y, out)
+        out *= h
+        out += y
+        return out
+    return integrator
+
+def rk2_inplace():
+    """Create an in-place Runge-Kutta RK2 midpoint integrator `I(y, f, t, h, out)`."""
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        k, ytmp = _buffers(work, y, 2)
+        f(t, y, k)
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, out)
+        out *= h
+        out += y
+        return out
+
+    return integrator
+
+def rk4_inplace():
+    """Create an in-place Runge-Kutta RK4 integrator `I(y, f, t, h, out)`.
+
+    The weighted sum of the stages k1/2 + k2 + k3 + k4/2 is
+    accumulated in `out` so that only two scratch buffers are needed.
+    """
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        k, ytmp = _buffers(work, y, 2)
+        # k1
+        f(t, y, k)
+        np.multiply(k, 0.5, out=out)
+        # k2
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, k)
+        out += k
+        # k3
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, k)
+        out += k
+        # k4
+        np.multiply(k, h, out=ytmp)
+        ytmp += y
+        f(t + h, ytmp, k)
+        k *= 0.5
+        out += k
+
+        # y + h/6 (k1 + 2*k2 + 2*k3 + k4)
+        out *= h/3
+        out += y
+        return out
+
+    return integrator
+
+def velocity_verlet_inplace():
+    """Create an in-place velocity Verlet integrator `I(y, f, t, h, out)`.
+
+    Like :func:`velocity_verlet_fsal`, the force at the end of a step
+    is re-used at the beginning of the next step (only for the same
+    positions and the same function `f`).
+    """
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        F, dy, x_last = _buffers(work, y, 3)
+        # (slices [:1] and [1:] give views even when positions are scalars)
+        out[:] = y
+        if not (work.get('f') is f and np.array_equal(out[:1], x_last[:1])):
+            f(t, out, F)
+        # half step velocity
+        np.multiply(F[1:], 0.5*h, out=dy[1:])
+        out[1:] += dy[1:]
+        # full step position
+        np.multiply(out[1:], h, out=dy[:1])
+        out[:1] += dy[:1]
+        # full step velocity (updated positions!)
+        f(t+h, out, F)
+        np.multiply(F[1:], 0.5*h, out=dy[1:])
+        out[1:] += dy[1:]
+
+        x_last[:1] = out[:1]
+        work['f'] = f
+        return out
+
+    return integrator
+
+#------------------------------------------------------------
+# adaptive integrators
+#
+# An embedded Runge-Kutta pair calculates two solutions of different
+# order from the same stages; their difference estimates the local
+# error of the step, which is used to choose the step size h so that
+# the error stays below a tolerance. The step size becomes small only
+# where it needs to be small (e.g., near the perihelion of an orbit).
+
+# Dormand-Prince 5(4) Butcher tableau
+DOPRI_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+DOPRI_A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84],
+]
+# 5th order weights (same as last row of A: "first same as last")
+DOPRI_B5 = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+# 4th order weights (only used for the error estimate)
+DOPRI_B4 = np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200,
+                     187/2100, 1/40])
+
+def rk45(y, f, t, h, k1=None):
+    """Dormand-Prince RK45 step with error estimate.
+
+    Arguments
+    ---------
+    y : array
+        ODE standard form vector at time `t`
+    f : function `f(t, y)`
+        ODE force vector
+    t : float
+        time
+    h : float
+        step size
+    k1 : array, optional
+        ``f(t, y)`` if it is already known (e.g., the last stage of the
+        previous step); saves one evaluation of `f`
+
+    Returns
+    -------
+    Tuple ``(y_new, error, k7)`` with the 5th order solution at `t+h`,
+    the estimate of the local error of `y_new` and ``f(t+h, y_new)``,
+    which can be passed as `k1` to the next step.
+    """
+    k = [f(t, y) if k1 is None else k1]
+    for i in range(1, 7):
+        dy = sum(a * ki for a, ki in zip(DOPRI_A[i], k) if a != 0)
+        k.append(f(t + DOPRI_C[i]*h, y + h*dy))
+    # k[6] was evaluated at y + h * sum(B5 * k), i.e., the new y
+    y_new = y + h*sum(b * ki for b, ki in zip(DOPRI_B5, k) if b != 0)
+    error = h*sum((b5 - b4) * ki for b5, b4, ki in zip(DOPRI_B5, DOPRI_B4, k))
+    return y_new, error, k[6]
+
+def integrate_adaptive(f, y0, t0=0, t_max=1, h=0.01, rtol=1e-6, atol=1e-9,
+                       h_min=1e-12, max_steps=10**6):
+    """Integrate the ODE `f(t, y)` with adaptive step size.
+
+    Each step is accepted if the error estimate of :func:`rk45` is
+    smaller than ``atol + rtol*|y|`` (root mean square over all
+    components) and the next step size is chosen from the error so
+    that steps grow where the solution is smooth and shrink where it
+    changes quickly.
+
+    Arguments
+    ---------
+    f : function `f(t, y)`
+        ODE force vector
+    y0 : array
+        initial value of the ODE standard form vector at `t0`
+    t0 : float
+        start time
+    t_max : float
+        time to integrate out to
+    h : float
+        initial trial step size
+    rtol : float
+        relative error tolerance per step
+    atol : float
+        absolute error tolerance per step
+    h_min : float
+        smallest allowed step size; a :exc:`RuntimeError` is raised
+        if the tolerance cannot be met with a larger step
+    max_steps : int
+        maximum number of accepted steps
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with the (non-uniform) times of all accepted
+    steps and the ODE standard form vectors at these times.
+    """
+    # safety factor and limits for changing h in one step
+    safety, grow_max, shrink_min = 0.9, 5.0, 0.2
+
+    t = t0
+    y = np.array(y0, dtype=np.float64)
+    times = [t]
+    y_values = [y]
+    k1 = None
+    while t < t_max:
+        if len(times) > max_steps:
+            raise RuntimeError("integrate_adaptive: more than {0} steps "
+                               "needed to reach t_max={1}".format(max_steps, t_max))
+        # do not step beyond t_max
+        h = min(h, t_max - t)
+        y_new, error, k7 = rk45(y, f, t, h, k1=k1)
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = np.sqrt(np.mean((error/scale)**2))
+        if err <= 1:
+            # accept step
+            t += h
+            y = y_new
+            k1 = k7
+            times.append(t)
+            y_values.append(y)
+        factor = grow_max if err == 0 else safety * err**(-1/5)
+        h *= min(grow_max, max(shrink_min, factor))
+        if h < h_min:
+            raise RuntimeError("integrate_adaptive: step size h={0} smaller "
+                               "than h_min={1} at t={2}".format(h, h_min, t))
+
+    return np.array(times), np.array(y_values)
+
 #------------------------------------------------------------
 # analysis
 
@@ -148,6 +660,8 @@ def kinetic_energy(v, m=1):
 def energy_conservation(t, y, U, **kwargs):
     """Energy drift (Tuckerman Eq 3.14.1)"""
     m = kwargs.get('m', 1)
+    # energies are always calculated in double precision
+    y = np.asarray(y, dtype=np.float64)
     x, v = y[:, 0], y[:, 1]
     KE = kinetic_energy(v, m=m)
     PE = U(x, **kwargs)
@@ -175,8 +689,133 @@ def energy_precision(energy, machine_precision=1e-15):
     DeltaE[zeros] = machine_precision
     return np.log10(DeltaE)
 
+class EnergyDrift:
+    """Accumulate energy conservation statistics during an integration.
+
+    An integration driver calls :meth:`update` with the current state
+    every `every` steps (pass the monitor in the `monitors` list of
+    the driver). Only running sums are kept, so the memory needed does
+    not depend on the length of the run and no second pass over the
+    trajectory is needed.
+
+    Attributes
+    ----------
+    E0 : float
+       initial energy
+    mean_drift : float
+       mean of |E/E0 - 1| (same as :func:`energy_conservation`)
+    max_drift : float
+       largest |E/E0 - 1|
+    n : int
+       number of energies that were accumulated
+
+    Example
+    -------
+    ::
+
+       drift = EnergyDrift(U_gravity, m=M_earth, every=10)
+       t, y = integrate_newton_2d(..., monitors=[drift])
+       print(drift.mean_drift, drift.max_drift)
+       times, log_drift = drift.precision()
+
+    """
+
+    def __init__(self, U, every=1, log_every=100, maxlen=10000,
+                 machine_precision=1e-15, **kwargs):
+        """Set up accumulators.
+
+        Arguments
+        ---------
+        U : function
+           potential energy function `U(x, **kwargs)`
+        every : int (default 1)
+           evaluate the energy every `every` integration steps
+        log_every : int (default 100)
+           store log10 |E/E0 - 1| for every `log_every`-th evaluation
+        maxlen : int (default 10000)
+           maximum length of the stored log10 series: when it gets
+           longer, every second value is dropped and `log_every` is
+           doubled
+        machine_precision : float
+           replaces E0 == 0 and |E/E0 - 1| == 0 as in
+           :func:`energy_precision`
+        **kwargs : keyword arguments
+           passed to `U`; the mass `m` is also used for the kinetic
+           energy
+        """
+        self.U = U
+        self.kwargs = kwargs
+        self.m = kwargs.get('m', 1)
+        self.every = every
+        self.log_every = log_every
+        self.maxlen = maxlen
+        self.machine_precision = machine_precision
+        self.E0 = None
+        self.n = 0
+        self._sum_drift = 0.
+        self.max_drift = 0.
+        self._times = []
+        self._log_drift = []
+
+    def energy(self, y, PE=None):
+        """Total energy of the ODE standard form vector `y`.
+
+        The potential energy `PE` can be provided if it is already
+        known (e.g., from a fused force and energy kernel).
+        """
+        y = np.asarray(y, dtype=np.float64)
+        KE = kinetic_energy(y[1], m=self.m)
+        if PE is None:
+            PE = self.U(y[0], **self.kwargs)
+        return np.sum(KE) + np.sum(PE)
+
+    def update(self, t, y, PE=None):
+        """Accumulate the energy of state `y` at time `t`."""
+        E = self.energy(y, PE=PE)
+        if self.E0 is None:
+            if np.isclose(E, 0, atol=self.machine_precision, rtol=self.machine_precision):
+                E = self.machine_precision
+            self.E0 = E
+        drift = abs(E/self.E0 - 1)
+        self._sum_drift += drift
+        self.max_drift = max(self.max_drift, drift)
+        if self.n % self.log_every == 0:
+            self._times.append(t)
+            self._log_drift.append(np.log10(max(drift, self.machine_precision)))
+            if len(self._times) > self.maxlen:
+                self._times = self._times[::2]
+                self._log_drift = self._log_drift[::2]
+                self.log_every *= 2
+        self.n += 1
+
+    @property
+    def mean_drift(self):
+        return self._sum_drift / self.n
+
+    def precision(self):
+        """Return times and log10 |E/E0 - 1| (decimated)."""
+        return np.array(self._times), np.array(self._log_drift)
+
+def energy_nbody(y, m=M_earth, **kwargs):
+    """Total energy KE + PE of an N-body system for each frame.
+
+    `y` is the (nframes, 2, N, d) array of positions and velocities
+    produced by :func:`integrate_newton_2d` with
+    :func:`F_gravity_nbody` and `m` are the masses of the bodies.
+    Other `kwargs` are passed to :func:`U_gravity_nbody`.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    KE = np.sum(kinetic_energy(y[:, 1], m=np.ravel(m)), axis=-1)
+    PE = U_gravity_nbody(y[:, 0], m=m, **kwargs)
+    return KE + PE
+
 def analyze_energies(t, y, U, step=1, **kwargs):
+    """Plot energies and the energy precision of the trajectory."""
+    # delayed import: importing matplotlib.pyplot is slow
+    import matplotlib.pyplot as plt
+
     m = kwargs.get('m', 1)
+    y = np.asarray(y, dtype=np.float64)
     x, v = y[:, 0], y[:, 1]
     KE = kinetic_energy(v, m=m)
     PE = U(x, **kwargs)
@@ -201,13 +840,272 @@ def analyze_energies(t, y, U, step=1, **kwargs):
     #return ax.figure
 
 
+#------------------------------------------------------------
+# linear forces
+#
+# For a force that is linear in the position, F(x) = -k x, Newton's
+# equations are linear and one step of any of the integrators above is
+# multiplication with a constant 2 x 2 matrix M, y(t+h) = M y(t) (in
+# d dimensions the same matrix acts on each cartesian component). The
+# exact solution is y(t) = U(t) y(0) with the propagator U(t). Instead
+# of stepping, the whole trajectory can be calculated with a few
+# matrix products for all times at once.
+
+def propagator(t, k=1, m=1):
+    """Exact propagator U(t) for the force F(x) = -k x.
+
+    Arguments
+    ---------
+    t : float or array
+       time(s)
+    k : float
+       force constant (can be zero or negative)
+    m : float
+       mass
+
+    Returns
+    -------
+    U : array
+       2 x 2 matrix (or array of matrices, one for each time) with
+       ``y(t) = U(t) @ y(0)``
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if k > 0:
+        omega = np.sqrt(k/m)
+        c, s = np.cos(omega*t), np.sin(omega*t)
+        U = [[c, s/omega], [-omega*s, c]]
+    elif k < 0:
+        kappa = np.sqrt(-k/m)
+        c, s = np.cosh(kappa*t), np.sinh(kappa*t)
+        U = [[c, s/kappa], [kappa*s, c]]
+    else:
+        U = [[np.ones_like(t), t], [np.zeros_like(t), np.ones_like(t)]]
+    # put the time axis first
+    return np.moveaxis(np.array(U), [0, 1], [-2, -1])
+
+def step_matrix(integrator, h, k=1, m=1, inplace=False):
+    """Matrix M of one step of `integrator` for the force F(x) = -k x.
+
+    The columns of M are the images of the unit vectors y = (1, 0) and
+    y = (0, 1) under one step of the integrator. With `inplace`, the
+    integrator is an in-place integrator `I(y, f, t, h, out)`.
+    """
+    def f(t, y, out=None):
+        if out is None:
+            return np.array([y[1], -k/m * y[0]])
+        out[0], out[1] = y[1], -k/m * y[0]
+        return out
+
+    columns = []
+    for e in ([1, 0], [0, 1]):
+        y = np.array(e, dtype=np.float64)
+        if inplace:
+            columns.append(integrator(y, f, 0, h, np.empty_like(y)))
+        else:
+            columns.append(integrator(y, f, 0, h))
+    return np.column_stack(columns)
+
+def iterate_linear_map(M, y0, n):
+    """Return ``[y0, M y0, M^2 y0, ..., M^(n-1) y0]``.
+
+    The array is filled by doubling: the first `p` entries multiplied
+    by M^p give the next `p` entries, and M^p is squared afterwards, so
+    only about log2(n) matrix products over blocks of frames are
+    needed. `y0` is a standard form vector (first axis: position,
+    velocity) of any shape.
+    """
+    y = np.empty((n,) + np.shape(y0))
+    y[0] = y0
+    P = M
+    filled = 1
+    while filled < n:
+        p = min(filled, n - filled)
+        y[filled:filled + p] = np.einsum('ij,nj...->ni...', P, y[:p])
+        filled += p
+        P = P @ P
+    return y
+
+def linear_force_constant(force, shape=(1,), **kwargs):
+    """Return k for a force F(r) = -k r or raise ValueError for any other force.
+
+    The force is probed at positions with the `shape` of the run (d-dim
+    vector or N x d array): unit displacements along each of the d axes
+    must all give the same restoring force -k along that axis only,
+    and the force at random positions must be -k r (which excludes
+    forces that couple particles).
+    """
+    shape = tuple(shape) or (1,)
+
+    def F(x):
+        return np.reshape(force(x, **kwargs), shape)
+
+    probes = []
+    for axis in range(shape[-1]):
+        x = np.zeros(shape)
+        x[..., axis] = 1
+        probes.append(x)
+    probes += [np.zeros(shape), np.random.default_rng(42).standard_normal(shape)]
+    with np.errstate(all="ignore"):
+        k = -F(probes[0]).flat[0]
+        linear = np.isfinite(k) and all(np.allclose(F(x), -k*x) for x in probes)
+    if not linear:
+        raise ValueError("force is not of the form F(r) = -k r")
+    return k
+
+#------------------------------------------------------------
+# instrumentation
+#
+# A Profile can be passed as `profile` to the integration driver. It
+# wraps the force function and the integrator with timers and counts
+# calls so that one can see where the time of a run goes. Without a
+# profile, the driver runs unchanged.
+
+class Profile:
+    """Count force evaluations and time the phases of an integration.
+
+    After a run with ``integrate_newton(..., profile=profile)``
+
+    - `force_calls` and `force_time` are the number of force
+      evaluations and the total time spent in the force function;
+    - `integrator_time` is the time spent in the integrator
+      (including the force evaluations), so that
+      :attr:`integrator_overhead` is the time for the integrator
+      arithmetic alone;
+    - :attr:`bookkeeping_time` is the rest of the run (storing `y`,
+      loop overhead, ...).
+
+    Results of several runs with the same profile are added up;
+    use :meth:`reset` to start over. ``print(profile)`` shows a
+    report. (Timers add a small overhead to each call, which is
+    included in the measured times.)
+    """
+
+    def __init__(self, verbose=False):
+        """Set up counters; with `verbose`, print a report after each run."""
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        """Set all counters and timers to zero."""
+        self.force_calls = 0
+        self.force_time = 0.
+        self.steps = 0
+        self.integrator_time = 0.
+        self.total_time = 0.
+
+    def wrap_force(self, force):
+        """Return `force` wrapped with a counter and a timer."""
+        def timed_force(*args, **kwargs):
+            start = time.perf_counter()
+            F = force(*args, **kwargs)
+            self.force_time += time.perf_counter() - start
+            self.force_calls += 1
+            return F
+        return timed_force
+
+    def wrap_integrator(self, integrator):
+        """Return `integrator` wrapped with a step counter and a timer."""
+        def timed_integrator(*args):
+            start = time.perf_counter()
+            y = integrator(*args)
+            self.integrator_time += time.perf_counter() - start
+            self.steps += 1
+            return y
+        return timed_integrator
+
+    def run(self, driver, **kwargs):
+        """Run `driver(**kwargs)` with instrumented force and integrator."""
+        kwargs['force'] = self.wrap_force(kwargs['force'])
+        kwargs['integrator'] = self.wrap_integrator(kwargs['integrator'])
+        start = time.perf_counter()
+        result = driver(**kwargs)
+        self.total_time += time.perf_counter() - start
+        if self.verbose:
+            print(self)
+        return result
+
+    @property
+    def time_per_force_call(self):
+        return self.force_time / self.force_calls if self.force_calls else 0.
+
+    @property
+    def integrator_overhead(self):
+        return self.integrator_time - self.force_time
+
+    @property
+    def bookkeeping_time(self):
+        return self.total_time - self.integrator_time
+
+    @property
+    def steps_per_second(self):
+        return self.steps / self.total_time if self.total_time else 0.
+
+    def __str__(self):
+        return "\n".join([
+            "steps:               {0:d} ({1:.0f} steps/s)".format(
+                self.steps, self.steps_per_second),
+            "total time:          {0:.4g} s".format(self.total_time),
+            "force evaluations:   {0:d} ({1:.3g} s/call)".format(
+                self.force_calls, self.time_per_force_call),
+            "force time:          {0:.4g} s".format(self.force_time),
+            "integrator overhead: {0:.4g} s".format(self.integrator_overhead),
+            "bookkeeping:         {0:.4g} s".format(self.bookkeeping_time),
+        ])
+
 #------------------------------------------------------------
 # ODE integration
 
+def _as_mass(mass, dtype=np.float64):
+    """Return `mass` as a scalar or as N x 1 array (one per particle) of type `dtype`.
+
+    Converting the mass to the precision of the trajectory prevents
+    float32 forces from being converted to float64 when they are
+    divided by the mass.
+    """
+    if np.ndim(mass) > 0:
+        # one mass per particle, broadcast over the d coordinates
+        return np.reshape(np.asarray(mass, dtype=dtype), (-1, 1))
+    return np.dtype(dtype).type(mass)
+
+
+class _FusedForce:
+    """Force function that also keeps the potential energy of its last call.
+
+    Wraps a fused kernel `FU` from :data:`FUSED_KERNELS` and the plain
+    `force`. While `record` is set, the fused kernel is called and the
+    positions, parameters and potential energy of each call are stored
+    so that the energy of a monitor can be taken from the last force
+    evaluation if it was at the same positions. Otherwise only the
+    force is calculated.
+    """
+
+    def __init__(self, FU, force):
+        self.FU = FU
+        self.force = force
+        self.record = False
+        self.x = self.U = self.kwargs = None
+
+    def __call__(self, x, **kwargs):
+        if not self.record:
+            return self.force(x, **kwargs)
+        F, U = self.FU(x, **kwargs)
+        self.x, self.U, self.kwargs = x.copy(), U, kwargs
+        return F
+
+    def potential(self, x, **kwargs):
+        """Stored potential energy at positions `x` or ``None``."""
+        if self.x is None or not np.array_equal(self.x, x):
+            return None
+        if (self.kwargs.keys() != kwargs.keys()
+                or not all(np.array_equal(kwargs[k], self.kwargs[k]) for k in kwargs)):
+            return None
+        return self.U
+
 
 def integrate_newton_2d(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100, h=0.001, mass=1,
-                        force=F_harmonic, integrator=euler,
-                        **kwargs):
+                        force=F_harmonic, integrator=euler, inplace=False,
+                        record_every=1, observables=None, monitors=None, profile=None,
+                        linear=False, dtype=np.float64, **kwargs):
     """Integrate Newton's equations of motions in 2D.
 
     Note that all problem parameters must be set consistently in the
@@ -216,18 +1114,25 @@ def integrate_newton_2d(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100, h=0
     The force function and the integrator must be able to work with
     n-dimensional position and velocity vectors.
 
+    An *ensemble* of N independent particles is integrated when `x0`
+    and `v0` are N x d arrays of initial conditions: all particles are
+    advanced together with a single call to the integrator per time
+    step (the force function must accept N x d arrays of positions,
+    as all the F_* functions do).
+
     Arguments
     ---------
     x0 : array
-       initial position
+       initial position (d-dim) or N x d array of initial positions
     v0 : array
-       initial velocity
+       initial velocity (d-dim) or N x d array of initial velocities
     t_max : float
        time to integrate out to
     h : float (default 0.001)
        integration time step
-    mass : float (default 1)
-       mass of the particle
+    mass : float or array (default 1)
+       mass of the particle; for an ensemble this can also be an array
+       with the N masses of the particles
     force : function `f(x, **kwargs)`
        function that returns the force when particle is
        at position `x`; kwargs can be used to customize, e.g.,
@@ -236,6 +1141,46 @@ def integrate_newton_2d(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100, h=0
        function that takes the ODE standard form vectors y and f
        together with the current time and the step `h` and returns
        y at time t+h.
+    inplace : bool (default False)
+       If ``True`` then `integrator` must be an in-place integrator
+       `I(y, f, t, h, out)` such as ``rk4_inplace()``, which writes
+       y at time t+h directly into the output array so that no
+       temporary arrays are created during the integration.
+    record_every : int (default 1)
+       Only store every `record_every`-th step. The integration is
+       still carried out with step `h`, but memory for the trajectory
+       is reduced by a factor `record_every`.
+    observables : dict, optional
+       Dictionary of functions ``{name: g(t, y)}`` that are evaluated
+       on the stored frames, where `t` and `y` are arrays of times and
+       ODE standard form vectors, as returned by this function. For
+       example, ``{"KE": lambda t, y: kinetic_energy(y[:, 1])}``.
+    monitors : list, optional
+       objects such as :class:`EnergyDrift` whose method
+       ``update(t, y)`` is called during the integration with the state
+       at every ``monitor.every``-th step (including the initial state);
+       force and potential energy are calculated together with a fused
+       kernel if possible (see :func:`integrate_newton_2d_chunks`)
+    profile : Profile, optional
+       If provided, count force evaluations and time the force
+       function, the integrator and the rest of the run (see
+       :class:`Profile`).
+    linear : bool or "exact" (default False)
+       For a force that is linear in the position, F = -k x, the
+       trajectory can be calculated without time stepping: with
+       ``True`` the trajectory of `integrator` is computed from powers
+       of its step matrix and with ``"exact"`` the exact solution is
+       used (see :func:`integrate_newton_2d_linear`). A :exc:`ValueError` is raised
+       if the force is not linear. All other options apply as
+       usual; monitors and observables are evaluated on the
+       calculated trajectory.
+    dtype : numpy dtype (default numpy.float64)
+       Floating point type of positions and velocities. With
+       ``numpy.float32`` large ensembles need half the memory and
+       are integrated faster, at the cost of larger rounding errors
+       (see ``benchmark_precision.py``). The times are always float64
+       and energies (:func:`energy_conservation`, :class:`EnergyDrift`)
+       are always calculated in float64.
     **kwargs : keyword arguments
        Other kwargs that are passed to the `force()` function (`mass`
        is added to the kwargs).
@@ -246,14 +1191,46 @@ def integrate_newton_2d(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100, h=0
     `y[:, 0]` is position and `y[:, 1]` velocity. Note that position
     and velocity are 2- or 3D arrays.
 
+    For an ensemble, `y` has shape ``(len(t), 2, N, d)`` and
+    ``y[:, :, j]`` is the trajectory of particle `j` in the same format
+    as for a single particle.
+
+    If `observables` are provided then the tuple ``(t, y, values)``
+    is returned where `values` is a dictionary with the array of
+    values for each observable.
+
     """
-    # code can be easily generalized to 3D
-    dim = len(x0)
-    assert len(v0) == dim
+    if profile is not None:
+        return profile.run(integrate_newton_2d, x0=x0, v0=v0, t_max=t_max, h=h,
+                           mass=mass, force=force, integrator=integrator,
+                           inplace=inplace, record_every=record_every,
+                           observables=observables, monitors=monitors,
+                           linear=linear, dtype=dtype, **kwargs)
+
+    if linear:
+        k = linear_force_constant(force, shape=np.shape(x0), **kwargs)
+        integrator = None if linear == "exact" else integrator
+        t_range, y_values = integrate_newton_2d_linear(x0=x0, v0=v0, t_max=t_max, h=h,
+                                                       mass=mass, k=k, integrator=integrator,
+                                                       inplace=inplace)
+        return _record_linear(t_range, y_values, record_every=record_every,
+                              observables=observables, monitors=monitors, dtype=dtype)
+
+    # d-dim vector for a single particle or N x d array for an ensemble
+    shape = np.shape(x0)
+    assert np.shape(v0) == shape
+    mass = _as_mass(mass, dtype)
+
+    if record_every != 1 or observables is not None or monitors:
+        return _integrate_newton_2d_recorded(x0=x0, v0=v0, t_max=t_max, h=h, mass=mass,
+                                             force=force, integrator=integrator,
+                                             inplace=inplace, record_every=record_every,
+                                             observables=observables, monitors=monitors,
+                                             dtype=dtype, **kwargs)
 
     Nsteps = int(t_max/h)
     t_range = h * np.arange(Nsteps)
-    y_values = np.zeros((len(t_range), 2, dim))
+    y_values = np.zeros((len(t_range), 2) + shape, dtype=dtype)
 
     # initial conditions
     y_values[0, 0, :] = x0
@@ -264,8 +1241,452 @@ def integrate_newton_2d(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100, h=0
         """ODE force vector (currently only for velocity-independent forces)"""
         return np.array([y[1], force(y[0], **kwargs)/mass])
 
+    if inplace:
+        def f_inplace(t, y, out):
+            """ODE force vector (in-place)"""
+            out[0] = y[1]
+            np.divide(force(y[0], **kwargs), mass, out=out[1])
+            return out
+
+        for i, t in enumerate(t_range[:-1]):
+            integrator(y_values[i], f_inplace, t, h, y_values[i+1])
+        return t_range, y_values
+
 
     for i, t in enumerate(t_range[:-1]):
         y_values[i+1, :] = integrator(y_values[i].copy(), f, t, h)
 
     return t_range, y_values
+
+
+def integrate_newton_2d_linear(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100,
+                               h=0.001, mass=1, k=1, integrator=None, inplace=False):
+    """Integrate Newton's equations of motions for the linear force F(r) = -k r.
+
+    No time stepping is done: With ``integrator=None``, the exact
+    solution is calculated with :func:`propagator` for all times. For
+    an `integrator` such as :func:`rk4`, the trajectory is the one that
+    the integrator would produce (up to rounding errors), calculated
+    from powers of the :func:`step_matrix`. This is much faster than
+    :func:`integrate_newton_2d` and the exact trajectory can be used as a
+    reference for the accuracy of integrators.
+
+    Arguments are the same as for :func:`integrate_newton_2d` except
+
+    k : float (default 1)
+       force constant
+    integrator : function `I(y, f, t, h)` or None
+       integrator whose trajectory is calculated; ``None`` gives
+       the exact solution
+    inplace : bool (default False)
+       `integrator` is an in-place integrator `I(y, f, t, h, out)`
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with times and the ODE standard form vector, as
+    for :func:`integrate_newton_2d`.
+
+    """
+    # the same matrix acts on all cartesian components of all particles
+    if np.ndim(mass) != 0:
+        raise ValueError("all particles must have the same (scalar) mass")
+    t_range = h * np.arange(int(t_max/h))
+    y0 = np.array([x0, v0], dtype=np.float64)
+    if integrator is None:
+        y_values = np.einsum('nij,j...->ni...', propagator(t_range, k=k, m=mass), y0)
+    else:
+        M = step_matrix(integrator, h, k=k, m=mass, inplace=inplace)
+        y_values = iterate_linear_map(M, y0, len(t_range))
+    return t_range, y_values
+
+
+def _record_linear(t_range, y_values, record_every=1, observables=None, monitors=None,
+                   dtype=np.float64):
+    """Apply the recording options of :func:`integrate_newton_2d` to a linear trajectory.
+
+    The trajectory from :func:`integrate_newton_2d_linear` contains
+    all steps. The `monitors` are updated at every
+    ``monitor.every``-th step (including the initial state) as in
+    :func:`integrate_newton_2d_chunks`, then every `record_every`-th
+    frame is kept (as `dtype`) and `observables` are evaluated.
+    """
+    for monitor in monitors or []:
+        for i in range(0, len(t_range), monitor.every):
+            monitor.update(t_range[i], y_values[i].astype(dtype))
+    t_range = t_range[::record_every]
+    y_values = np.ascontiguousarray(y_values[::record_every], dtype=dtype)
+    if observables is None:
+        return t_range, y_values
+    values = {name: g(t_range, y_values) for name, g in observables.items()}
+    return t_range, y_values, values
+
+
+def integrate_newton_2d_chunks(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100,
+                               h=0.001, mass=1, force=F_harmonic, integrator=euler,
+                               inplace=False, record_every=1, monitors=None,
+                               chunksize=10000, start_frame=0, dtype=np.float64,
+                               **kwargs):
+    """Integrate Newton's equations of motions in 2D and yield the trajectory in chunks.
+
+    Generator version of :func:`integrate_newton_2d`: instead of
+    keeping the whole trajectory in memory, it yields consecutive
+    pieces of at most `chunksize` frames. Memory use is therefore
+    independent of `t_max`. Concatenating all chunks gives exactly
+    the same trajectory as :func:`integrate_newton_2d`.
+
+    All arguments are the same as for :func:`integrate_newton_2d`.
+
+    Arguments
+    ---------
+    record_every : int (default 1)
+       only yield every `record_every`-th step
+    monitors : list, optional
+       objects such as :class:`EnergyDrift` whose method
+       ``update(t, y)`` is called with the state at every
+       ``monitor.every``-th step (including the initial state).
+       For a monitor with potential energy ``monitor.U`` such that
+       ``(force, monitor.U)`` has a fused kernel in
+       :data:`FUSED_KERNELS`, force and potential energy are calculated
+       together in the steps in which the monitor is updated (float64
+       only) and the energy at the end of a step is
+       taken from the last force evaluation when it was at the same
+       positions with the same parameters (as for the velocity Verlet
+       integrators).
+    chunksize : int (default 10000)
+       number of (recorded) frames per chunk
+    start_frame : int (default 0)
+       index of the first frame; `x0` and `v0` are the state at this
+       frame (used to continue a run, see :func:`resume_newton_2d`)
+    dtype : numpy dtype (default numpy.float64)
+       floating point type of positions and velocities
+
+    Yields
+    ------
+    Tuple ``(t, y)`` with times and ODE standard form vectors of the
+    next `chunksize` frames (fewer for the last chunk).
+
+    Example
+    -------
+    Calculate the maximum distance from the origin without storing
+    the trajectory::
+
+       rmax = 0
+       for t, y in integrate_newton_2d_chunks(..., t_max=1e6):
+           rmax = max(rmax, np.max(np.linalg.norm(y[:, 0], axis=-1)))
+
+    """
+    shape = np.shape(x0)
+    assert np.shape(v0) == shape
+    mass = _as_mass(mass, dtype)
+
+    # same number of steps as integrate_newton_2d()
+    Nsteps = int(t_max/h)
+
+    fused = None
+    if monitors and np.dtype(dtype) == np.float64:
+        # energies are always float64, so only re-use float64 energies
+        kernels = [FUSED_KERNELS.get((force, getattr(monitor, 'U', None)))
+                   for monitor in monitors]
+        FU = set(kernels) - {None}
+        if len(FU) == 1:
+            fused = force = _FusedForce(FU.pop(), force)
+            fused_monitors = [monitor for monitor, kernel in zip(monitors, kernels)
+                              if kernel is not None]
+
+    if inplace:
+        def f_inplace(t, y, out):
+            """ODE force vector (in-place)"""
+            out[0] = y[1]
+            np.divide(force(y[0], **kwargs), mass, out=out[1])
+            return out
+
+        def step(y, i, out):
+            integrator(y, f_inplace, h*i, h, out)
+    else:
+        def f(t, y):
+            """ODE force vector (currently only for velocity-independent forces)"""
+            return np.array([y[1], force(y[0], **kwargs)/mass])
+
+        def step(y, i, out):
+            out[:] = integrator(y.copy(), f, h*i, h)
+
+    # state at the beginning of the next chunk
+    y = np.zeros((2,) + shape, dtype=dtype)
+    y[0] = x0
+    y[1] = v0
+
+    if monitors:
+        take_step = step
+
+        def step(y, i, out):
+            due = [monitor for monitor in monitors if (i + 1) % monitor.every == 0]
+            if fused is not None:
+                fused.record = bool(due)
+            take_step(y, i, out)
+            for monitor in due:
+                PE = None
+                if fused is not None and monitor in fused_monitors:
+                    PE = fused.potential(out[0], **monitor.kwargs)
+                if PE is None:
+                    monitor.update(h*(i + 1), out)
+                else:
+                    monitor.update(h*(i + 1), out, PE=PE)
+
+        for monitor in monitors:
+            monitor.update(h*start_frame*record_every, y)
+
+    # scratch states for the steps that are not recorded
+    work = [np.zeros_like(y), np.zeros_like(y)]
+
+    def advance(y, i, out):
+        """Take `record_every` steps from step `i` and store the result in `out`"""
+        for j in range(record_every - 1):
+            step(y, i + j, work[j % 2])
+            y = work[j % 2]
+        step(y, i + record_every - 1, out)
+
+    # number of recorded frames
+    Nframes = len(range(0, Nsteps, record_every))
+
+    for start in range(start_frame, Nframes, chunksize):
+        n = min(chunksize, Nframes - start)
+        steps = np.arange(start, start + n) * record_every
+        t_range = h * steps
+        y_values = np.zeros((n, 2) + shape, dtype=dtype)
+        y_values[0] = y
+        for i in range(n - 1):
+            advance(y_values[i], steps[i], y_values[i+1])
+        if start + n < Nframes:
+            # first frame of the next chunk
+            advance(y_values[-1], steps[-1], y)
+        yield t_range, y_values
+
+
+def _integrate_newton_2d_recorded(x0, v0, t_max, h, record_every=1, observables=None,
+                                  dtype=np.float64, **kwargs):
+    """Store every `record_every`-th frame and evaluate `observables`.
+
+    Implements `record_every` and `observables` for
+    :func:`integrate_newton_2d` on top of
+    :func:`integrate_newton_2d_chunks`.
+    """
+    Nframes = len(range(0, int(t_max/h), record_every))
+    t_range = np.zeros(Nframes)
+    y_values = np.zeros((Nframes, 2) + np.shape(x0), dtype=dtype)
+    start = 0
+    for t, y in integrate_newton_2d_chunks(x0=x0, v0=v0, t_max=t_max, h=h,
+                                           record_every=record_every, dtype=dtype,
+                                           **kwargs):
+        t_range[start:start + len(t)] = t
+        y_values[start:start + len(y)] = y
+        start += len(y)
+
+    if observables is None:
+        return t_range, y_values
+    values = {name: g(t_range, y_values) for name, g in observables.items()}
+    return t_range, y_values, values
+
+
+def integrate_newton_2d_to_npy(filename, x0=np.array([0, 0]), v0=np.array([0, 1]),
+                               t_max=100, h=0.001, record_every=1, chunksize=10000,
+                               dtype=np.float64, **kwargs):
+    """Integrate Newton's equations of motions in 2D and write `y` to a file.
+
+    The trajectory is calculated in chunks with
+    :func:`integrate_newton_2d_chunks` and each chunk is written
+    directly into a memory-mapped numpy ``.npy`` file so that only one
+    chunk has to be kept in memory.
+
+    Arguments
+    ---------
+    filename : str
+       name of the ``.npy`` file (will be overwritten)
+    record_every : int (default 1)
+       only store every `record_every`-th step
+    chunksize : int (default 10000)
+       number of frames per chunk
+    dtype : numpy dtype (default numpy.float64)
+       floating point type of the trajectory and the file
+
+    All other arguments are the same as for :func:`integrate_newton_2d`.
+
+    Returns
+    -------
+    y : numpy.memmap
+       The ODE standard form vector, stored in `filename`. The times
+       are not stored; they are ``t = h * record_every * np.arange(len(y))``.
+       Load the file later with ``np.load(filename, mmap_mode="r")``.
+
+    """
+    Nframes = len(range(0, int(t_max/h), record_every))
+    y_values = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                         shape=(Nframes, 2) + np.shape(x0))
+    start = 0
+    for t, y in integrate_newton_2d_chunks(x0=x0, v0=v0, t_max=t_max, h=h,
+                                           record_every=record_every,
+                                           chunksize=chunksize, dtype=dtype, **kwargs):
+        y_values[start:start + len(y)] = y
+        start += len(y)
+    y_values.flush()
+    return y_values
+
+
+def integrate_newton_2d_checkpointed(filename, checkpoint, x0=np.array([0, 0]),
+                                     v0=np.array([0, 1]), t_max=100, h=0.001, mass=1,
+                                     force=F_harmonic, integrator=euler, inplace=False,
+                                     record_every=1, chunksize=10000, dtype=np.float64,
+                                     **kwargs):
+    """Integrate Newton's equations of motions in 2D with checkpoints.
+
+    The trajectory is written chunk by chunk into the ``.npy`` file
+    `filename` (as in :func:`integrate_newton_2d_to_npy`). After each
+    chunk, the step index, the current state and all parameters of
+    the run are saved to the ``.npz`` file `checkpoint`. If the run is
+    interrupted, continue it with :func:`resume_newton_2d`. The
+    resumed run produces exactly the same numbers as an uninterrupted
+    run because every step only depends on the state and the step
+    index.
+
+    Arguments
+    ---------
+    filename : str
+       name of the ``.npy`` file for the trajectory (will be overwritten)
+    checkpoint : str
+       name of the checkpoint file (will be overwritten)
+
+    All other arguments are the same as for
+    :func:`integrate_newton_2d_chunks`; `kwargs` for the force must be
+    numbers or arrays so that they can be saved in the checkpoint.
+    The `dtype` of the run is the type of the trajectory file.
+
+    Returns
+    -------
+    y : numpy.memmap
+       The ODE standard form vector, stored in `filename`.
+
+    """
+    Nframes = len(range(0, int(t_max/h), record_every))
+    y_values = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                         shape=(Nframes, 2) + np.shape(x0))
+    y_values[0, 0] = x0
+    y_values[0, 1] = v0
+    y_values.flush()
+    del y_values
+
+    parameters = dict(filename=filename, x0=x0, v0=v0, t_max=t_max, h=h, mass=mass,
+                      force=_function_name(force), integrator=_function_name(integrator),
+                      weights=getattr(integrator, "weights", np.zeros(0)),
+                      inplace=inplace, record_every=record_every, chunksize=chunksize)
+    for name, value in kwargs.items():
+        if np.asarray(value).dtype.kind not in "biufc":
+            raise ValueError("force parameter {0}={1!r} cannot be saved in a "
+                             "checkpoint".format(name, value))
+        parameters["kw_" + name] = value
+    _save_checkpoint(checkpoint, parameters, 0)
+    return resume_newton_2d(checkpoint, force, integrator)
+
+
+def resume_newton_2d(checkpoint, force, integrator):
+    """Continue a run of :func:`integrate_newton_2d_checkpointed`.
+
+    The `force` and `integrator` functions cannot be stored in the
+    checkpoint; they must be the same ones as in the original run (a
+    :exc:`ValueError` is raised if their names or, for
+    :func:`symplectic_composition` integrators, their weights
+    differ). Create new stateful integrators such as
+    ``velocity_verlet_fsal()`` for the resumed run. Monitors are not
+    saved in checkpoints.
+
+    Arguments
+    ---------
+    checkpoint : str
+       name of the checkpoint file
+    force : function
+       force function of the original run
+    integrator : function
+       integrator of the original run
+
+    Returns
+    -------
+    y : numpy.memmap
+       The complete ODE standard form vector, stored in the
+       trajectory file of the run.
+
+    """
+    with np.load(checkpoint) as data:
+        parameters = {name: data[name][()] for name in data.files}
+    frame = int(parameters.pop("frame"))
+    for name, function in (("force", force), ("integrator", integrator)):
+        if parameters[name] != _function_name(function):
+            raise ValueError("{0} {1} differs from {2} of the checkpointed run".format(
+                name, _function_name(function), parameters[name]))
+    weights = getattr(integrator, "weights", np.zeros(0))
+    if not np.array_equal(parameters["weights"], weights):
+        raise ValueError("integrator weights {0} differ from {1} of the checkpointed "
+                         "run".format(weights, parameters["weights"]))
+    kwargs = {name[3:]: value for name, value in parameters.items()
+              if name.startswith("kw_")}
+
+    y_values = np.load(str(parameters["filename"]), mmap_mode="r+")
+    # continue from the last frame that was saved (it is calculated
+    # again, with identical results)
+    start = frame
+    for t, y in integrate_newton_2d_chunks(x0=y_values[frame, 0], v0=y_values[frame, 1],
+                                           t_max=float(parameters["t_max"]),
+                                           h=float(parameters["h"]),
+                                           mass=parameters["mass"], force=force,
+                                           integrator=integrator,
+                                           inplace=bool(parameters["inplace"]),
+                                           record_every=int(parameters["record_every"]),
+                                           chunksize=int(parameters["chunksize"]),
+                                           start_frame=frame, dtype=y_values.dtype,
+                                           **kwargs):
+        y_values[start:start + len(y)] = y
+        y_values.flush()
+        start += len(y)
+        _save_checkpoint(checkpoint, parameters, start - 1)
+    return y_values
+
+
+def _function_name(function):
+    """Name of a function or callable object (such as a PairForce) for checkpoints."""
+    return getattr(function, "__qualname__", type(function).__qualname__)
+
+
+def _save_checkpoint(checkpoint, parameters, frame):
+    """Atomically write `parameters` and the last saved `frame` to `checkpoint`."""
+    tmp = checkpoint + ".tmp"
+    with open(tmp, "wb") as out:
+        np.savez(out, frame=frame, **parameters)
+    os.replace(tmp, checkpoint)
+
+
+def integrate_newton_2d_adaptive(x0=np.array([0, 0]), v0=np.array([0, 1]), t_max=100,
+                                 h=0.001, mass=1, force=F_harmonic,
+                                 rtol=1e-6, atol=1e-9, **kwargs):
+    """Integrate Newton's equations of motions in 2D with adaptive time steps.
+
+    Uses the embedded Dormand-Prince RK45 integrator :func:`rk45` via
+    :func:`integrate_adaptive`, which chooses the step size so that the
+    local error stays below ``atol + rtol*|y|``. The initial step `h`
+    is only a first guess. All other arguments are the same as for
+    :func:`integrate_newton_2d`.
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with times and the ODE standard form vector,
+    like :func:`integrate_newton_2d`, except that the times `t` are
+    *not* equally spaced.
+
+    """
+    shape = np.shape(x0)
+    assert np.shape(v0) == shape
+    if np.ndim(mass) > 0:
+        mass = np.reshape(mass, (-1, 1))
+
+    def f(t, y):
+        """ODE force vector (currently only for velocity-independent forces)"""
+        return np.array([y[1], force(y[0], **kwargs)/mass])
+
+    y0 = np.array([x0, v0], dtype=np.float64)
+    return integrate_adaptive(f, y0, t0=0, t_max=t_max, h=h, rtol=rtol, atol=atol)
@@ -2,8 +2,12 @@
 # Copyright (c) 2016-2018 Oliver Beckstein.
 # License: BSD-3 clause
 
+import time
+
 import numpy as np
-import matplotlib.pyplot as plt
+
+# matplotlib is only imported by the plotting function
+# analyze_energies() so that the numerical code only needs numpy.
 
 #------------------------------------------------------------
 # forces
@@ -75,7 +79,7 @@ def velocity_verlet(y, f, t, h):
     For comparing different algorithms it is ok to use this
     implementation for convenience. For production level code you
     should use a better implementation that saves the second force
-    evaluation.
+    evaluation such as the one created by :func:`velocity_verlet_fsal`.
 
     """
     # half step velocity
@@ -89,6 +93,175 @@ def velocity_verlet(y, f, t, h):
 
     return y
 
+def velocity_verlet_fsal():
+    """Create a velocity Verlet integrator that remembers the last force.
+
+    The force calculated at the end of a step (at the new positions)
+    is the same force that is needed at the beginning of the next
+    step. The integrator returned by this function keeps it around
+    and re-uses it so that velocity Verlet only needs *one* force
+    evaluation per step ("first same as last", FSAL) instead of the
+    two in :func:`velocity_verlet`.
+
+    The stored force is only used when the positions passed in are
+    identical to the positions at the end of the previous step and
+    the ODE function `f` is the same object; otherwise the force is
+    recalculated, so the integrator can be re-used for a different
+    trajectory. (A function `f` whose parameters were changed in place
+    is not detected; use a new integrator in that case.)
+
+    Returns
+    -------
+    integrator : function `I(y, f, t, h)`
+       velocity Verlet integrator with the same call signature as
+       :func:`velocity_verlet`
+
+    Example
+    -------
+    Use a new integrator for each trajectory::
+
+       t, y = integrate_newton(..., integrator=velocity_verlet_fsal())
+
+    """
+    # state carried over between steps: positions and force at t+h and
+    # the ODE function that calculated the force
+    last = {'x': None, 'F': None, 'f': None}
+
+    def integrator(y, f, t, h):
+        # (the position is a scalar so the comparison is cheap)
+        if last['f'] is f and y[0] == last['x']:
+            F = last['F']
+        else:
+            F = f(t, y)
+        # half step velocity
+        y[1] += 0.5*h * F[1]
+        # full step position
+        y[0] += h*y[1]
+        # full step velocity (updated positions!); remember the force
+        # for the next step
+        F = f(t+h, y)
+        y[1] += 0.5*h * F[1]
+
+        last['x'] = y[0]
+        last['F'] = F
+        last['f'] = f
+        return y
+
+    return integrator
+
+#------------------------------------------------------------
+# in-place integrators
+#
+# In-place integrators take as arguments y, f, t, h, out and write
+# y at time t+h into the array `out` (which must be a different array
+# than y). f is a function f(t, y, out) that must write the ODE force
+# vector into `out`. No new arrays are created during a step: all
+# intermediate stages are stored in scratch buffers that are allocated
+# once when the integrator is first used. Create the integrators with
+# the *_inplace() functions and use them with ``inplace=True`` in the
+# integration driver.
+
+def _buffers(work, y, n):
+    """Return `n` scratch arrays shaped like `y` (allocated only once)."""
+    buffers = work.get('buffers')
+    if buffers is None or buffers[0].shape != y.shape or buffers[0].dtype != y.dtype:
+        # new buffers invalidate any other state stored in work
+        work.clear()
+        buffers = work['buffers'] = [np.empty_like(y) for i in range(n)]
+    return buffers
+
+def euler_inplace():
+    """Create an in-place Euler integrator `I(y, f, t, h, out)`."""
+    def integrator(y, f, t, h, out):
+        f(t, y, out)
+        out *= h
+        out += y
+        return out
+    return integrator
+
+def rk2_inplace():
+    """Create an in-place Runge-Kutta RK2 midpoint integrator `I(y, f, t, h, out)`."""
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        k, ytmp = _buffers(work, y, 2)
+        f(t, y, k)
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, out)
+        out *= h
+        out += y
+        return out
+
+    return integrator
+
+def rk4_inplace():
+    """Create an in-place Runge-Kutta RK4 integrator `I(y, f, t, h, out)`.
+
+    The weighted sum of the stages k1/2 + k2 + k3 + k4/2 is
+    accumulated in `out` so that only two scratch buffers are needed.
+    """
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        k, ytmp = _buffers(work, y, 2)
+        # k1
+        f(t, y, k)
+        np.multiply(k, 0.5, out=out)
+        # k2
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, k)
+        out += k
+        # k3
+        np.multiply(k, 0.5*h, out=ytmp)
+        ytmp += y
+        f(t + 0.5*h, ytmp, k)
+        out += k
+        # k4
+        np.multiply(k, h, out=ytmp)
+        ytmp += y
+        f(t + h, ytmp, k)
+        k *= 0.5
+        out += k
+
+        # y + h/6 (k1 + 2*k2 + 2*k3 + k4)
+        out *= h/3
+        out += y
+        return out
+
+    return integrator
+
+def velocity_verlet_inplace():
+    """Create an in-place velocity Verlet integrator `I(y, f, t, h, out)`.
+
+    Like :func:`velocity_verlet_fsal`, the force at the end of a step
+    is re-used at the beginning of the next step (only for the same
+    positions and the same function `f`).
+    """
+    work = {}
+
+    def integrator(y, f, t, h, out):
+        F, = _buffers(work, y, 1)
+        out[:] = y
+        # position and velocity are scalars so no temporary arrays
+        # are created in the updates below
+        if not (work.get('f') is f and out[0] == work['x']):
+            f(t, out, F)
+        # half step velocity
+        out[1] += 0.5*h * F[1]
+        # full step position
+        out[0] += h*out[1]
+        # full step velocity (updated positions!)
+        f(t+h, out, F)
+        out[1] += 0.5*h * F[1]
+
+        work['x'] = out[0]
+        work['f'] = f
+        return out
+
+    return integrator
+
 #------------------------------------------------------------
 # analysis
 
@@ -125,7 +298,108 @@ def energy_precision(energy, machine_precision=1e-15):
     DeltaE[zeros] = machine_precision
     return np.log10(DeltaE)
 
+class EnergyDrift:
+    """Accumulate energy conservation statistics during an integration.
+
+    An integration driver calls :meth:`update` with the current state
+    every `every` steps (pass the monitor in the `monitors` list of
+    the driver). Only running sums are kept, so the memory needed does
+    not depend on the length of the run and no second pass over the
+    trajectory is needed.
+
+    Attributes
+    ----------
+    E0 : float
+       initial energy
+    mean_drift : float
+       mean of |E/E0 - 1| (same as :func:`energy_conservation`)
+    max_drift : float
+       largest |E/E0 - 1|
+    n : int
+       number of energies that were accumulated
+
+    Example
+    -------
+    ::
+
+       drift = EnergyDrift(U_harmonic, every=10)
+       t, y = integrate_newton(..., monitors=[drift])
+       print(drift.mean_drift, drift.max_drift)
+       times, log_drift = drift.precision()
+
+    """
+
+    def __init__(self, U, m=1, every=1, log_every=100, maxlen=10000,
+                 machine_precision=1e-15):
+        """Set up accumulators.
+
+        Arguments
+        ---------
+        U : function
+           potential energy function `U(x)`
+        m : float (default 1)
+           mass of the particle
+        every : int (default 1)
+           evaluate the energy every `every` integration steps
+        log_every : int (default 100)
+           store log10 |E/E0 - 1| for every `log_every`-th evaluation
+        maxlen : int (default 10000)
+           maximum length of the stored log10 series: when it gets
+           longer, every second value is dropped and `log_every` is
+           doubled
+        machine_precision : float
+           replaces E0 == 0 and |E/E0 - 1| == 0 as in
+           :func:`energy_precision`
+        """
+        self.U = U
+        self.m = m
+        self.every = every
+        self.log_every = log_every
+        self.maxlen = maxlen
+        self.machine_precision = machine_precision
+        self.E0 = None
+        self.n = 0
+        self._sum_drift = 0.
+        self.max_drift = 0.
+        self._times = []
+        self._log_drift = []
+
+    def energy(self, y):
+        """Total energy of the ODE standard form vector `y`."""
+        return kinetic_energy(y[1], m=self.m) + self.U(y[0])
+
+    def update(self, t, y):
+        """Accumulate the energy of state `y` at time `t`."""
+        E = self.energy(y)
+        if self.E0 is None:
+            if np.isclose(E, 0, atol=self.machine_precision, rtol=self.machine_precision):
+                E = self.machine_precision
+            self.E0 = E
+        drift = abs(E/self.E0 - 1)
+        self._sum_drift += drift
+        self.max_drift = max(self.max_drift, drift)
+        if self.n % self.log_every == 0:
+            self._times.append(t)
+            self._log_drift.append(np.log10(max(drift, self.machine_precision)))
+            if len(self._times) > self.maxlen:
+                self._times = self._times[::2]
+                self._log_drift = self._log_drift[::2]
+                self.log_every *= 2
+        self.n += 1
+
+    @property
+    def mean_drift(self):
+        return self._sum_drift / self.n
+
+    def precision(self):
+        """Return times and log10 |E/E0 - 1| (decimated)."""
+        return np.array(self._times), np.array(self._log_drift)
+
 def analyze_energies(t, y, U, m=1, step=1):
+    """Plot energies and the energy precision of the trajectory."""
+    # delayed import: importing matplotlib.pyplot is slow
+    import matplotlib.pyplot as plt
+
     x, v = y.T
     KE = kinetic_energy(v, m=m)
     PE = U(x)
@@ -149,6 +423,200 @@ def analyze_energies(t, y, U, m=1, step=1):
 
     #return ax.figure
 
+#------------------------------------------------------------
+# linear forces
+#
+# For a force that is linear in the position, F(x) = -k x, Newton's
+# equations are linear and one step of any of the integrators above is
+# multiplication with a constant 2 x 2 matrix M, y(t+h) = M y(t) (in
+# d dimensions the same matrix acts on each cartesian component). The
+# exact solution is y(t) = U(t) y(0) with the propagator U(t). Instead
+# of stepping, the whole trajectory can be calculated with a few
+# matrix products for all times at once.
+
+def propagator(t, k=1, m=1):
+    """Exact propagator U(t) for the force F(x) = -k x.
+
+    Arguments
+    ---------
+    t : float or array
+       time(s)
+    k : float
+       force constant (can be zero or negative)
+    m : float
+       mass
+
+    Returns
+    -------
+    U : array
+       2 x 2 matrix (or array of matrices, one for each time) with
+       ``y(t) = U(t) @ y(0)``
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if k > 0:
+        omega = np.sqrt(k/m)
+        c, s = np.cos(omega*t), np.sin(omega*t)
+        U = [[c, s/omega], [-omega*s, c]]
+    elif k < 0:
+        kappa = np.sqrt(-k/m)
+        c, s = np.cosh(kappa*t), np.sinh(kappa*t)
+        U = [[c, s/kappa], [kappa*s, c]]
+    else:
+        U = [[np.ones_like(t), t], [np.zeros_like(t), np.ones_like(t)]]
+    # put the time axis first
+    return np.moveaxis(np.array(U), [0, 1], [-2, -1])
+
+def step_matrix(integrator, h, k=1, m=1, inplace=False):
+    """Matrix M of one step of `integrator` for the force F(x) = -k x.
+
+    The columns of M are the images of the unit vectors y = (1, 0) and
+    y = (0, 1) under one step of the integrator. With `inplace`, the
+    integrator is an in-place integrator `I(y, f, t, h, out)`.
+    """
+    def f(t, y, out=None):
+        if out is None:
+            return np.array([y[1], -k/m * y[0]])
+        out[0], out[1] = y[1], -k/m * y[0]
+        return out
+
+    columns = []
+    for e in ([1, 0], [0, 1]):
+        y = np.array(e, dtype=np.float64)
+        if inplace:
+            columns.append(integrator(y, f, 0, h, np.empty_like(y)))
+        else:
+            columns.append(integrator(y, f, 0, h))
+    return np.column_stack(columns)
+
+def iterate_linear_map(M, y0, n):
+    """Return ``[y0, M y0, M^2 y0, ..., M^(n-1) y0]``.
+
+    The array is filled by doubling: the first `p` entries multiplied
+    by M^p give the next `p` entries, and M^p is squared afterwards, so
+    only about log2(n) matrix products over blocks of frames are
+    needed. `y0` is a standard form vector (first axis: position,
+    velocity) of any shape.
+    """
+    y = np.empty((n,) + np.shape(y0))
+    y[0] = y0
+    P = M
+    filled = 1
+    while filled < n:
+        p = min(filled, n - filled)
+        y[filled:filled + p] = np.einsum('ij,nj...->ni...', P, y[:p])
+        filled += p
+        P = P @ P
+    return y
+
+def linear_force_constant(force, **kwargs):
+    """Return k for a force F(x) = -k x or raise ValueError if `force` is not linear."""
+    with np.errstate(all="ignore"):
+        F0, F1, F2 = (np.ravel(force(np.array([x], dtype=np.float64), **kwargs))[0]
+                      for x in (0, 1, 2))
+    if not (np.isclose(F0, 0) and np.isclose(F2, 2*F1)):
+        raise ValueError("force is not linear in x")
+    return -F1
+
+#------------------------------------------------------------
+# instrumentation
+#
+# A Profile can be passed as `profile` to the integration driver. It
+# wraps the force function and the integrator with timers and counts
+# calls so that one can see where the time of a run goes. Without a
+# profile, the driver runs unchanged.
+
+class Profile:
+    """Count force evaluations and time the phases of an integration.
+
+    After a run with ``integrate_newton(..., profile=profile)``
+
+    - `force_calls` and `force_time` are the number of force
+      evaluations and the total time spent in the force function;
+    - `integrator_time` is the time spent in the integrator
+      (including the force evaluations), so that
+      :attr:`integrator_overhead` is the time for the integrator
+      arithmetic alone;
+    - :attr:`bookkeeping_time` is the rest of the run (storing `y`,
+      loop overhead, ...).
+
+    Results of several runs with the same profile are added up;
+    use :meth:`reset` to start over. ``print(profile)`` shows a
+    report. (Timers add a small overhead to each call, which is
+    included in the measured times.)
+    """
+
+    def __init__(self, verbose=False):
+        """Set up counters; with `verbose`, print a report after each run."""
+        self.verbose = verbose
+        self.reset()
+
+    def reset(self):
+        """Set all counters and timers to zero."""
+        self.force_calls = 0
+        self.force_time = 0.
+        self.steps = 0
+        self.integrator_time = 0.
+        self.total_time = 0.
+
+    def wrap_force(self, force):
+        """Return `force` wrapped with a counter and a timer."""
+        def timed_force(*args, **kwargs):
+            start = time.perf_counter()
+            F = force(*args, **kwargs)
+            self.force_time += time.perf_counter() - start
+            self.force_calls += 1
+            return F
+        return timed_force
+
+    def wrap_integrator(self, integrator):
+        """Return `integrator` wrapped with a step counter and a timer."""
+        def timed_integrator(*args):
+            start = time.perf_counter()
+            y = integrator(*args)
+            self.integrator_time += time.perf_counter() - start
+            self.steps += 1
+            return y
+        return timed_integrator
+
+    def run(self, driver, **kwargs):
+        """Run `driver(**kwargs)` with instrumented force and integrator."""
+        kwargs['force'] = self.wrap_force(kwargs['force'])
+        kwargs['integrator'] = self.wrap_integrator(kwargs['integrator'])
+        start = time.perf_counter()
+        result = driver(**kwargs)
+        self.total_time += time.perf_counter() - start
+        if self.verbose:
+            print(self)
+        return result
+
+    @property
+    def time_per_force_call(self):
+        return self.force_time / self.force_calls if self.force_calls else 0.
+
+    @property
+    def integrator_overhead(self):
+        return self.integrator_time - self.force_time
+
+    @property
+    def bookkeeping_time(self):
+        return self.total_time - self.integrator_time
+
+    @property
+    def steps_per_second(self):
+        return self.steps / self.total_time if self.total_time else 0.
+
+    def __str__(self):
+        return "\n".join([
+            "steps:               {0:d} ({1:.0f} steps/s)".format(
+                self.steps, self.steps_per_second),
+            "total time:          {0:.4g} s".format(self.total_time),
+            "force evaluations:   {0:d} ({1:.3g} s/call)".format(
+                self.force_calls, self.time_per_force_call),
+            "force time:          {0:.4g} s".format(self.force_time),
+            "integrator overhead: {0:.4g} s".format(self.integrator_overhead),
+            "bookkeeping:         {0:.4g} s".format(self.bookkeeping_time),
+        ])
+
 #------------------------------------------------------------
 # ODE integration
 
@@ -169,9 +637,21 @@ def f_standard(t, y, force, m=1):
     """
     return np.array([y[1], force(y[0])/m])
 
+def f_standard_inplace(t, y, out, force, m=1):
+    """Force vector in standard ODE form (n=2), written into `out`
+
+    Same as :func:`f_standard` but the result is stored in the
+    array `out` instead of creating a new array.
+    """
+    out[0] = y[1]
+    out[1] = force(y[0])/m
+    return out
+
 
 def integrate_newton(x0=0, v0=1, t_max=100, h=0.001, mass=1,
-                     force=F_harmonic, integrator=euler):
+                     force=F_harmonic, integrator=euler, inplace=False,
+                     record_every=1, observables=None, monitors=None, profile=None,
+                     linear=False):
     """Integrate Newton's equations of motions.
 
     Note that all problem parameters such as spring constant k must be
@@ -196,13 +676,69 @@ def integrate_newton(x0=0, v0=1, t_max=100, h=0.001, mass=1,
        function that takes the ODE standard form vectors y and f
        together with the current time and the step `h` and returns
        y at time t+h.
+    inplace : bool (default False)
+       If ``True`` then `integrator` must be an in-place integrator
+       `I(y, f, t, h, out)` such as ``rk4_inplace()``, which writes
+       y at time t+h directly into the output array so that no
+       temporary arrays are created during the integration.
+    record_every : int (default 1)
+       Only store every `record_every`-th step. The integration is
+       still carried out with step `h`, but memory for the trajectory
+       is reduced by a factor `record_every`.
+    observables : dict, optional
+       Dictionary of functions ``{name: g(t, y)}`` that are evaluated
+       on the stored frames, where `t` and `y` are arrays of times and
+       ODE standard form vectors, as returned by this function. For
+       example, ``{"KE": lambda t, y: kinetic_energy(y[:, 1])}``.
+    monitors : list, optional
+       objects such as :class:`EnergyDrift` whose method
+       ``update(t, y)`` is called during the integration with the state
+       at every ``monitor.every``-th step (including the initial state)
+    profile : Profile, optional
+       If provided, count force evaluations and time the force
+       function, the integrator and the rest of the run (see
+       :class:`Profile`).
+    linear : bool or "exact" (default False)
+       For a force that is linear in the position, F = -k x, the
+       trajectory can be calculated without time stepping: with
+       ``True`` the trajectory of `integrator` is computed from powers
+       of its step matrix and with ``"exact"`` the exact solution is
+       used (see :func:`integrate_newton_linear`). A :exc:`ValueError` is raised
+       if the force is not linear. All other options apply as
+       usual; monitors and observables are evaluated on the
+       calculated trajectory.
 
     Returns
     -------
     Tuple ``(t, y)`` with times and the ODE standard form vector.
     `y[:, 0]` is position and `y[:, 1]` velocity.
 
+    If `observables` are provided then the tuple ``(t, y, values)``
+    is returned where `values` is a dictionary with the array of
+    values for each observable.
+
     """
+    if profile is not None:
+        return profile.run(integrate_newton, x0=x0, v0=v0, t_max=t_max, h=h,
+                           mass=mass, force=force, integrator=integrator,
+                           inplace=inplace, record_every=record_every,
+                           observables=observables, monitors=monitors,
+                           linear=linear)
+
+    if linear:
+        k = linear_force_constant(force)
+        integrator = None if linear == "exact" else integrator
+        t_range, y_values = integrate_newton_linear(x0=x0, v0=v0, t_max=t_max, h=h,
+                                                    mass=mass, k=k, integrator=integrator,
+                                                    inplace=inplace)
+        return _record_linear(t_range, y_values, record_every=record_every,
+                              observables=observables, monitors=monitors)
+
+    if record_every != 1 or observables is not None or monitors:
+        return _integrate_newton_recorded(x0=x0, v0=v0, t_max=t_max, h=h, mass=mass,
+                                          force=force, integrator=integrator,
+                                          inplace=inplace, record_every=record_every,
+                                          observables=observables, monitors=monitors)
 
     Nsteps = t_max/h
     t_range = h * np.arange(Nsteps)
@@ -211,6 +747,15 @@ def integrate_newton(x0=0, v0=1, t_max=100, h=0.001, mass=1,
     # initial conditions
     y_values[0, :] = x0, v0
 
+    if inplace:
+        def f(t, y, out):
+            """ODE force vector (in-place)."""
+            return f_standard_inplace(t, y, out, force, m=mass)
+
+        for i, t in enumerate(t_range[:-1]):
+            integrator(y_values[i], f, t, h, y_values[i+1])
+        return t_range, y_values
+
     # build a function with "our" force
     def f(t, y):
         """ODE force vector."""
@@ -221,3 +766,217 @@ def integrate_newton(x0=0, v0=1, t_max=100, h=0.001, mass=1,
 
     return t_range, y_values
 
+
+def integrate_newton_linear(x0=0, v0=1, t_max=100, h=0.001, mass=1, k=1,
+                            integrator=None, inplace=False):
+    """Integrate Newton's equations of motions for the linear force F(x) = -k x.
+
+    No time stepping is done: With ``integrator=None``, the exact
+    solution is calculated with :func:`propagator` for all times. For
+    an `integrator` such as :func:`rk4`, the trajectory is the one that
+    the integrator would produce (up to rounding errors), calculated
+    from powers of the :func:`step_matrix`. This is much faster than
+    :func:`integrate_newton` and the exact trajectory can be used as a
+    reference for the accuracy of integrators.
+
+    Arguments are the same as for :func:`integrate_newton` except
+
+    k : float (default 1)
+       force constant
+    integrator : function `I(y, f, t, h)` or None
+       integrator whose trajectory is calculated; ``None`` gives
+       the exact solution
+    inplace : bool (default False)
+       `integrator` is an in-place integrator `I(y, f, t, h, out)`
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with times and the ODE standard form vector, as
+    for :func:`integrate_newton`.
+
+    """
+    t_range = h * np.arange(t_max/h)
+    y0 = np.array([x0, v0], dtype=np.float64)
+    if integrator is None:
+        y_values = np.einsum('nij,j...->ni...', propagator(t_range, k=k, m=mass), y0)
+    else:
+        M = step_matrix(integrator, h, k=k, m=mass, inplace=inplace)
+        y_values = iterate_linear_map(M, y0, len(t_range))
+    return t_range, y_values
+
+
+def _record_linear(t_range, y_values, record_every=1, observables=None, monitors=None):
+    """Apply the recording options of :func:`integrate_newton` to a linear trajectory.
+
+    The trajectory from :func:`integrate_newton_linear` contains all
+    steps. The `monitors` are updated at every ``monitor.every``-th
+    step (including the initial state) as in
+    :func:`integrate_newton_chunks`, then every `record_every`-th
+    frame is kept and `observables` are evaluated.
+    """
+    for monitor in monitors or []:
+        for i in range(0, len(t_range), monitor.every):
+            monitor.update(t_range[i], y_values[i])
+    t_range = t_range[::record_every]
+    y_values = np.ascontiguousarray(y_values[::record_every])
+    if observables is None:
+        return t_range, y_values
+    values = {name: g(t_range, y_values) for name, g in observables.items()}
+    return t_range, y_values, values
+
+
+def _number_of_steps(t_max, h):
+    """Number of steps, ``len(np.arange(t_max/h))`` without creating the array."""
+    return max(int(np.ceil(t_max/h)), 0)
+
+
+def integrate_newton_chunks(x0=0, v0=1, t_max=100, h=0.001, mass=1,
+                            force=F_harmonic, integrator=euler, inplace=False,
+                            record_every=1, monitors=None, chunksize=10000):
+    """Integrate Newton's equations of motions and yield the trajectory in chunks.
+
+    Generator version of :func:`integrate_newton`: instead of keeping
+    the whole trajectory in memory, it yields consecutive pieces of at
+    most `chunksize` frames. Memory use is therefore independent of
+    `t_max`. Concatenating all chunks gives exactly the same trajectory
+    as :func:`integrate_newton`.
+
+    All arguments are the same as for :func:`integrate_newton`.
+
+    Arguments
+    ---------
+    record_every : int (default 1)
+       only yield every `record_every`-th step
+    monitors : list, optional
+       objects such as :class:`EnergyDrift` whose method
+       ``update(t, y)`` is called with the state at every
+       ``monitor.every``-th step (including the initial state)
+    chunksize : int (default 10000)
+       number of (recorded) frames per chunk
+
+    Yields
+    ------
+    Tuple ``(t, y)`` with times and ODE standard form vectors of the
+    next `chunksize` frames (fewer for the last chunk).
+
+    """
+    # same number of steps as integrate_newton()
+    Nsteps = _number_of_steps(t_max, h)
+
+    if inplace:
+        def f(t, y, out):
+            """ODE force vector (in-place)."""
+            return f_standard_inplace(t, y, out, force, m=mass)
+
+        def step(y, i, out):
+            integrator(y, f, h*i, h, out)
+    else:
+        def f(t, y):
+            """ODE force vector."""
+            return f_standard(t, y, force, m=mass)
+
+        def step(y, i, out):
+            out[:] = integrator(y.copy(), f, h*i, h)
+
+    # state at the beginning of the next chunk
+    y = np.array([x0, v0], dtype=np.float64)
+
+    if monitors:
+        take_step = step
+
+        def step(y, i, out):
+            take_step(y, i, out)
+            for monitor in monitors:
+                if (i + 1) % monitor.every == 0:
+                    monitor.update(h*(i + 1), out)
+
+        for monitor in monitors:
+            monitor.update(0., y)
+
+    # scratch states for the steps that are not recorded
+    work = [np.zeros_like(y), np.zeros_like(y)]
+
+    def advance(y, i, out):
+        """Take `record_every` steps from step `i` and store the result in `out`"""
+        for j in range(record_every - 1):
+            step(y, i + j, work[j % 2])
+            y = work[j % 2]
+        step(y, i + record_every - 1, out)
+
+    # number of recorded frames
+    Nframes = len(range(0, Nsteps, record_every))
+
+    for start in range(0, Nframes, chunksize):
+        n = min(chunksize, Nframes - start)
+        steps = np.arange(start, start + n) * record_every
+        t_range = h * steps
+        y_values = np.zeros((n, 2))
+        y_values[0] = y
+        for i in range(n - 1):
+            advance(y_values[i], steps[i], y_values[i+1])
+        if start + n < Nframes:
+            # first frame of the next chunk
+            advance(y_values[-1], steps[-1], y)
+        yield t_range, y_values
+
+
+def _integrate_newton_recorded(t_max, h, record_every=1, observables=None, **kwargs):
+    """Store every `record_every`-th frame and evaluate `observables`.
+
+    Implements `record_every` and `observables` for
+    :func:`integrate_newton` on top of :func:`integrate_newton_chunks`.
+    """
+    Nframes = len(range(0, _number_of_steps(t_max, h), record_every))
+    t_range = np.zeros(Nframes)
+    y_values = np.zeros((Nframes, 2))
+    start = 0
+    for t, y in integrate_newton_chunks(t_max=t_max, h=h, record_every=record_every,
+                                        **kwargs):
+        t_range[start:start + len(t)] = t
+        y_values[start:start + len(y)] = y
+        start += len(y)
+
+    if observables is None:
+        return t_range, y_values
+    values = {name: g(t_range, y_values) for name, g in observables.items()}
+    return t_range, y_values, values
+
+
+def integrate_newton_to_npy(filename, t_max=100, h=0.001, record_every=1, chunksize=10000,
+                            **kwargs):
+    """Integrate Newton's equations of motions and write `y` to a file.
+
+    The trajectory is calculated in chunks with
+    :func:`integrate_newton_chunks` and each chunk is written directly
+    into a memory-mapped numpy ``.npy`` file so that only one chunk has
+    to be kept in memory.
+
+    Arguments
+    ---------
+    filename : str
+       name of the ``.npy`` file (will be overwritten)
+    record_every : int (default 1)
+       only store every `record_every`-th step
+    chunksize : int (default 10000)
+       number of frames per chunk
+
+    All other arguments are the same as for :func:`integrate_newton`.
+
+    Returns
+    -------
+    y : numpy.memmap
+       The ODE standard form vector, stored in `filename`. The times
+       are not stored; they are ``t = h * record_every * np.arange(len(y))``.
+       Load the file later with ``np.load(filename, mmap_mode="r")``.
+
+    """
+    Nframes = len(range(0, _number_of_steps(t_max, h), record_every))
+    y_values = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64,
+                                         shape=(Nframes, 2))
+    start = 0
+    for t, y in integrate_newton_chunks(t_max=t_max, h=h, record_every=record_every,
+                                        chunksize=chunksize, **kwargs):
+        y_values[start:start + len(y)] = y
+        start += len(y)
+    y_values.flush()
+    return y_values
@@ -0,0 +1,293 @@
+# Short-range pair forces with cell lists and Verlet neighbor lists
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# The force functions in integrators2.py act on each particle
+# separately (central forces) and F_gravity_nbody() sums over all N^2
+# pairs. Short-range pair potentials such as Lennard-Jones are
+# truncated at a cutoff rc, so each particle only interacts with the
+# few particles within rc and the cost can be O(N) instead of O(N^2):
+#
+# - cell list: space is divided into cells of size >= rc; the
+#   partners of a particle are all in the same or in neighboring
+#   cells (3^d cells in d dimensions).
+# - Verlet neighbor list: all pairs within rc + skin are stored and
+#   re-used for many steps. The list only needs to be rebuilt (with
+#   the cell list) when a particle has moved more than skin/2 since
+#   the last build, because only then can a pair that was not in the
+#   list have come closer than rc.
+#
+# Pairs are generated with numpy operations over all particles: the
+# Python loops only run over the 3^d neighbor cells and over the
+# number of particles in the fullest cell.
+#
+# PairForce(pair_lennard_jones, cutoff=2.5, box=L) is a force function
+# that returns N x d forces for N x d positions and can be used with
+# integrate_newton_2d(); PairForce.energy() is the potential energy.
+
+import itertools
+
+import numpy as np
+
+#------------------------------------------------------------
+# pair potentials
+#
+# Each function takes the squared distances r2 of the pairs and
+# returns the potential energies U and the scalar f = -(dU/dr)/r, so
+# that the force on particle i from particle j is f * (r_i - r_j).
+
+def pair_lennard_jones(r2, epsilon=1, sigma=1, **kwargs):
+    """Lennard-Jones potential U = 4 eps [(sigma/r)^12 - (sigma/r)^6]"""
+    s6 = (sigma**2/r2)**3
+    U = 4*epsilon*(s6**2 - s6)
+    f = 24*epsilon*(2*s6**2 - s6)/r2
+    return U, f
+
+def pair_power(r2, k=1, p=12, **kwargs):
+    """Repulsive power law U = k / r^p"""
+    U = k * r2**(-0.5*p)
+    f = p * U / r2
+    return U, f
+
+def pair_harmonic(r2, k=1, r0=1, **kwargs):
+    """Soft spheres U = 1/2 k (r0 - r)^2 for r < r0 (use cutoff=r0)"""
+    r = np.sqrt(r2)
+    overlap = np.maximum(r0 - r, 0)
+    U = 0.5*k*overlap**2
+    f = k*overlap/r
+    return U, f
+
+#------------------------------------------------------------
+# pair search
+
+def minimum_image(dr, box=None):
+    """Apply the minimum image convention for a periodic `box` (in place)."""
+    if box is not None:
+        dr -= box * np.round(dr / box)
+    return dr
+
+def all_pairs(r, cutoff, box=None):
+    """All pairs i < j closer than `cutoff` by checking all N^2 pairs.
+
+    Reference implementation for :func:`cell_list_pairs`; returns the
+    pairs in the same format.
+    """
+    i, j = np.triu_indices(len(r), k=1)
+    dr = minimum_image(r[i] - r[j], box)
+    close = np.sum(dr**2, axis=-1) < cutoff**2
+    return i[close], j[close]
+
+def cell_list_pairs(r, cutoff, box=None):
+    """Find all pairs i < j closer than `cutoff` with a cell list.
+
+    Parameters
+    ----------
+    r : array
+      N x d array of positions
+    cutoff : float
+      pair distance cutoff
+    box : array or float, optional
+      edge lengths of a periodic orthorhombic box; positions may be
+      outside the box. Without a box, the bounding box of the
+      particles is divided into cells and there are no periodic images.
+
+    Returns
+    -------
+    i, j : arrays
+      indices of the particles in each pair (with ``i < j``)
+    """
+    r = np.asarray(r, dtype=np.float64)
+    N, dim = r.shape
+    if box is not None:
+        box = np.broadcast_to(np.asarray(box, dtype=np.float64), (dim,))
+        origin = np.zeros(dim)
+        extent = box
+        # at least 3 cells per dimension to find each pair only once
+        # through the neighbor cells; fewer cells are still correct
+        ncells = np.maximum(np.floor(box / cutoff).astype(int), 1)
+        x = r % box
+    else:
+        origin = r.min(axis=0)
+        extent = r.max(axis=0) - origin
+        # limit the number of (mostly empty) cells for dilute systems
+        volume = np.prod(extent[extent > 0]) if np.any(extent > 0) else 0
+        size = max(cutoff, (volume / max(N, 1))**(1/dim))
+        ncells = np.maximum(np.floor(extent / size).astype(int), 1)
+        x = r - origin
+    cellsize = extent / ncells
+
+    # cell coordinates (d integers) and cell number of each particle
+    c = np.minimum((x / np.where(cellsize > 0, cellsize, 1)).astype(int), ncells - 1)
+    strides = np.cumprod(np.concatenate([[1], ncells[:-1]]))
+    cell = c @ strides
+
+    # particles sorted by cell: the particles of cell k are
+    # order[start[k]:start[k] + count[k]]
+    order = np.argsort(cell, kind="stable")
+    count = np.bincount(cell, minlength=np.prod(ncells))
+    start = np.concatenate([[0], np.cumsum(count)[:-1]])
+
+    # different neighbor cell offsets in each dimension (with fewer
+    # than 3 periodic cells, -1 and +1 are the same cell)
+    if box is not None:
+        shifts = [sorted({s % n for s in (-1, 0, 1)}) for n in ncells]
+    else:
+        shifts = [(-1, 0, 1)] * dim
+
+    particles = np.arange(N)
+    pairs_i, pairs_j = [], []
+    for offset in itertools.product(*shifts):
+        nc = c + offset
+        if box is not None:
+            nc %= ncells
+            valid = particles
+        else:
+            inside = np.all((nc >= 0) & (nc < ncells), axis=-1)
+            valid = particles[inside]
+            nc = nc[inside]
+        ncell = nc @ strides
+        ncount = count[ncell]
+        for k in range(ncount.max(initial=0)):
+            has_k = k < ncount
+            i = valid[has_k]
+            j = order[start[ncell[has_k]] + k]
+            keep = i < j
+            pairs_i.append(i[keep])
+            pairs_j.append(j[keep])
+
+    i = np.concatenate(pairs_i) if pairs_i else np.zeros(0, dtype=int)
+    j = np.concatenate(pairs_j) if pairs_j else np.zeros(0, dtype=int)
+    dr = minimum_image(r[i] - r[j], box)
+    close = np.sum(dr**2, axis=-1) < cutoff**2
+    return i[close], j[close]
+
+
+class NeighborList:
+    """Verlet neighbor list with a skin.
+
+    All pairs within ``cutoff + skin`` are stored. The list is rebuilt
+    with :func:`cell_list_pairs` only when a particle has moved more
+    than ``skin/2`` since the last build.
+
+    Attributes
+    ----------
+    i, j : arrays
+       pairs in the list
+    builds : int
+       number of times the list was built
+    """
+
+    def __init__(self, cutoff, skin=0.3, box=None):
+        """Set up an empty neighbor list.
+
+        Arguments
+        ---------
+        cutoff : float
+           interaction cutoff
+        skin : float (default 0.3)
+           extra distance for pairs in the list; a larger skin means
+           fewer rebuilds but more pairs
+        box : array or float, optional
+           edge lengths of a periodic box
+        """
+        self.cutoff = cutoff
+        self.skin = skin
+        self.box = box
+        self.r0 = None
+        self.i = self.j = None
+        self.builds = 0
+
+    def needs_update(self, r):
+        """``True`` if any particle moved more than skin/2 since the last build."""
+        if self.r0 is None or self.r0.shape != np.shape(r):
+            return True
+        dr = minimum_image(r - self.r0, self.box)
+        return np.max(np.sum(dr**2, axis=-1), initial=0) > (0.5*self.skin)**2
+
+    def update(self, r):
+        """Return the pairs ``i, j`` for positions `r`, rebuilding if necessary."""
+        if self.needs_update(r):
+            self.i, self.j = cell_list_pairs(r, self.cutoff + self.skin, box=self.box)
+            self.r0 = np.array(r, dtype=np.float64)
+            self.builds += 1
+        return self.i, self.j
+
+
+class PairForce:
+    """Forces and energy of a truncated and shifted pair potential.
+
+    Example
+    -------
+    Lennard-Jones fluid of N particles in a periodic box of size L::
+
+       F = PairForce(pair_lennard_jones, cutoff=2.5, box=L)
+       t, y = integrate_newton_2d(x0=x0, v0=v0, force=F,
+                                  integrator=velocity_verlet_inplace(),
+                                  inplace=True)
+       drift = EnergyDrift(F.energy)
+
+    """
+
+    def __init__(self, pair=pair_lennard_jones, cutoff=2.5, skin=0.3, box=None,
+                 neighborlist=True, **params):
+        """Set up the pair potential.
+
+        Arguments
+        ---------
+        pair : function
+           pair potential `pair(r2, **params)` that returns ``U, f``
+           (see :func:`pair_lennard_jones`)
+        cutoff : float
+           no interactions beyond `cutoff`; the potential is shifted
+           so that it is zero at the cutoff
+        skin : float (default 0.3)
+           skin of the :class:`NeighborList`
+        box : array or float, optional
+           edge lengths of a periodic box
+        neighborlist : bool (default True)
+           use a Verlet neighbor list; with ``False``, the pairs are
+           found with a new cell list at every call
+        **params : keyword arguments
+           parameters of `pair`
+        """
+        self.pair = pair
+        self.cutoff = cutoff
+        self.box = box
+        self.params = params
+        self.U_cutoff = pair(np.float64(cutoff)**2, **params)[0]
+        self.neighbors = NeighborList(cutoff, skin=skin, box=box) if neighborlist else None
+
+    def pairs(self, r):
+        """Pairs ``i, j`` with displacements `dr` and squared distances `r2` within the cutoff."""
+        if self.neighbors is not None:
+            i, j = self.neighbors.update(r)
+        else:
+            i, j = cell_list_pairs(r, self.cutoff, box=self.box)
+        dr = minimum_image(r[i] - r[j], self.box)
+        r2 = np.sum(dr**2, axis=-1)
+        inside = r2 < self.cutoff**2
+        return i[inside], j[inside], dr[inside], r2[inside]
+
+    def __call__(self, r, **kwargs):
+        """Forces (N x d) on all particles at positions `r` (N x d)."""
+        r = np.asarray(r)
+        i, j, dr, r2 = self.pairs(r)
+        U, f = self.pair(r2, **self.params)
+        fij = f[:, np.newaxis] * dr
+        N = len(r)
+        F = np.empty(r.shape, dtype=np.result_type(r, np.float32))
+        for k in range(r.shape[1]):
+            # Newton's third law: +fij on i and -fij on j
+            F[:, k] = (np.bincount(i, weights=fij[:, k], minlength=N)
+                       - np.bincount(j, weights=fij[:, k], minlength=N))
+        return F
+
+    def energy(self, r, **kwargs):
+        """Total potential energy of the particles at positions `r`."""
+        r = np.asarray(r)
+        if r.ndim == 3:
+            # trajectory
+            return np.array([self.energy(ri) for ri in r])
+        i, j, dr, r2 = self.pairs(r)
+        U, f = self.pair(r2, **self.params)
+        return np.sum(U - self.U_cutoff)
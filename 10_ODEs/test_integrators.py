@@ -0,0 +1,32 @@
+# Tests for the integration drivers in integrators_solution.py
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+#
+# Run with
+#
+#   python -m pytest test_integrators.py
+
+import numpy as np
+import pytest
+
+import integrators_solution as integrators
+
+
+@pytest.mark.parametrize("t_max,h", [(0.3, 0.1), (1, 0.003), (10, 0.7), (100, 0.001),
+                                     (2.5, 0.25), (0, 0.1)])
+def test_number_of_steps(t_max, h):
+    assert integrators._number_of_steps(t_max, h) == len(np.arange(t_max/h))
+
+
+@pytest.mark.parametrize("record_every", [1, 7])
+def test_chunks_step_count(record_every):
+    # t_max/h = 333.33...
+    kwargs = dict(x0=1, v0=0, t_max=1, h=0.003, integrator=integrators.rk4)
+    t_ref, y_ref = integrators.integrate_newton(**kwargs)
+    chunks = list(integrators.integrate_newton_chunks(record_every=record_every,
+                                                      chunksize=50, **kwargs))
+    t = np.concatenate([t for t, y in chunks])
+    y = np.concatenate([y for t, y in chunks])
+    assert len(t_ref) == len(np.arange(1/0.003))
+    assert np.array_equal(t, t_ref[::record_every])
+    assert np.array_equal(y, y_ref[::record_every])
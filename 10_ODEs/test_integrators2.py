@@ -0,0 +1,41 @@
+# Tests for the n-dimensional integration drivers in integrators2_solution.py
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+#
+# Run with
+#
+#   python -m pytest test_integrators2.py
+
+import numpy as np
+import pytest
+
+import integrators2_solution as integrators2
+
+
+def F_anisotropic(r, **kwargs):
+    return -np.array([1, 4]) * r
+
+
+def test_linear_ensemble():
+    x0 = np.array([[1., 0.], [0., 2.], [-1., 0.5]])
+    v0 = np.zeros_like(x0)
+    kwargs = dict(x0=x0, v0=v0, t_max=5, h=0.01, force=integrators2.F_harmonic,
+                  integrator=integrators2.rk4, k=2)
+    t, y = integrators2.integrate_newton_2d(linear=True, **kwargs)
+    t_ref, y_ref = integrators2.integrate_newton_2d(**kwargs)
+    assert np.allclose(y, y_ref, atol=1e-12)
+
+
+def test_linear_anisotropic_force():
+    with pytest.raises(ValueError):
+        integrators2.integrate_newton_2d(x0=np.array([1., 0.]), v0=np.array([0., 1.]),
+                                         t_max=1, h=0.01, force=F_anisotropic,
+                                         integrator=integrators2.rk4, linear=True)
+
+
+def test_linear_mass_array():
+    with pytest.raises(ValueError):
+        integrators2.integrate_newton_2d(x0=np.array([[1., 0.], [0., 1.]]),
+                                         v0=np.zeros((2, 2)), mass=np.array([[1.], [2.]]),
+                                         t_max=1, h=0.01, force=integrators2.F_harmonic,
+                                         integrator=integrators2.rk4, linear=True)
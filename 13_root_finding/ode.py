@@ -2,6 +2,8 @@
 # Copyright (c) 2016-2019 Oliver Beckstein.
 # License: BSD-3 clause
 
+import numpy as np
+
 
 #------------------------------------------------------------
 # integrators
@@ -41,7 +43,7 @@ def velocity_verlet(y, f, t, h):
     For comparing different algorithms it is ok to use this
     implementation for convenience. For production level code you
     should use a better implementation that saves the second force
-    evaluation.
+    evaluation such as the one created by :func:`velocity_verlet_fsal`.
 
     """
     # half step velocity
@@ -56,5 +58,330 @@ def velocity_verlet(y, f, t, h):
 
     return y
 
+def velocity_verlet_fsal():
+    """Create a velocity Verlet integrator that remembers the last force.
+
+    The force calculated at the end of a step (at the new positions)
+    is the same force that is needed at the beginning of the next
+    step. The integrator returned by this function keeps it around
+    and re-uses it so that velocity Verlet only needs *one* force
+    evaluation per step ("first same as last", FSAL) instead of the
+    two in :func:`velocity_verlet`.
+
+    The stored force is only used when the positions passed in are
+    identical to the positions at the end of the previous step and
+    the ODE function `f` is the same object; otherwise the force is
+    recalculated, so the integrator can be re-used for a different
+    trajectory. (A function `f` whose parameters were changed in place
+    is not detected; use a new integrator in that case.)
+
+    Returns
+    -------
+    integrator : function `I(y, f, t, h)`
+       velocity Verlet integrator with the same call signature as
+       :func:`velocity_verlet`
+
+    Example
+    -------
+    Use a new integrator for each trajectory::
+
+       integrator = velocity_verlet_fsal()
+       for i in range(nsteps):
+           y[:] = integrator(y, f, t, h)
+           t += h
+
+    """
+    # state carried over between steps: positions and force at t+h and
+    # the ODE function that calculated the force
+    last = {'x': None, 'F': None, 'f': None}
+
+    def integrator(y, f, t, h):
+        if last['f'] is f and np.array_equal(y[0], last['x']):
+            F = last['F']
+        else:
+            F = f(t, y)
+        # half step velocity
+        y[1] += 0.5*h * F[1]
+        # full step position
+        y[0] += h*y[1]
+        # full step velocity (updated positions!); remember the force
+        # for the next step
+        F = f(t+h, y)
+        y[1] += 0.5*h * F[1]
+
+        last['x'] = np.copy(y[0])
+        last['F'] = F
+        last['f'] = f
+        return y
+
+    return integrator
+
+
+#------------------------------------------------------------
+# adaptive integrators
+#
+# An embedded Runge-Kutta pair calculates two solutions of different
+# order from the same stages; their difference estimates the local
+# error of the step, which is used to choose the step size h so that
+# the error stays below a tolerance. The step size becomes small only
+# where it needs to be small (e.g., near the perihelion of an orbit).
+
+# Dormand-Prince 5(4) Butcher tableau
+DOPRI_C = np.array([0, 1/5, 3/10, 4/5, 8/9, 1, 1])
+DOPRI_A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+    [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84],
+]
+# 5th order weights (same as last row of A: "first same as last")
+DOPRI_B5 = np.array([35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0])
+# 4th order weights (only used for the error estimate)
+DOPRI_B4 = np.array([5179/57600, 0, 7571/16695, 393/640, -92097/339200,
+                     187/2100, 1/40])
+
+def rk45(y, f, t, h, k1=None):
+    """Dormand-Prince RK45 step with error estimate.
+
+    Arguments
+    ---------
+    y : array
+        ODE standard form vector at time `t`
+    f : function `f(t, y)`
+        ODE force vector
+    t : float
+        time
+    h : float
+        step size
+    k1 : array, optional
+        ``f(t, y)`` if it is already known (e.g., the last stage of the
+        previous step); saves one evaluation of `f`
+
+    Returns
+    -------
+    Tuple ``(y_new, error, k7)`` with the 5th order solution at `t+h`,
+    the estimate of the local error of `y_new` and ``f(t+h, y_new)``,
+    which can be passed as `k1` to the next step.
+    """
+    k = [f(t, y) if k1 is None else k1]
+    for i in range(1, 7):
+        dy = sum(a * ki for a, ki in zip(DOPRI_A[i], k) if a != 0)
+        k.append(f(t + DOPRI_C[i]*h, y + h*dy))
+    # k[6] was evaluated at y + h * sum(B5 * k), i.e., the new y
+    y_new = y + h*sum(b * ki for b, ki in zip(DOPRI_B5, k) if b != 0)
+    error = h*sum((b5 - b4) * ki for b5, b4, ki in zip(DOPRI_B5, DOPRI_B4, k))
+    return y_new, error, k[6]
+
+def integrate_adaptive(f, y0, t0=0, t_max=1, h=0.01, rtol=1e-6, atol=1e-9,
+                       h_min=1e-12, max_steps=10**6):
+    """Integrate the ODE `f(t, y)` with adaptive step size.
+
+    Each step is accepted if the error estimate of :func:`rk45` is
+    smaller than ``atol + rtol*|y|`` (root mean square over all
+    components) and the next step size is chosen from the error so
+    that steps grow where the solution is smooth and shrink where it
+    changes quickly.
+
+    Arguments
+    ---------
+    f : function `f(t, y)`
+        ODE force vector
+    y0 : array
+        initial value of the ODE standard form vector at `t0`
+    t0 : float
+        start time
+    t_max : float
+        time to integrate out to
+    h : float
+        initial trial step size
+    rtol : float
+        relative error tolerance per step
+    atol : float
+        absolute error tolerance per step
+    h_min : float
+        smallest allowed step size; a :exc:`RuntimeError` is raised
+        if the tolerance cannot be met with a larger step
+    max_steps : int
+        maximum number of accepted steps
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with the (non-uniform) times of all accepted
+    steps and the ODE standard form vectors at these times.
+    """
+    # safety factor and limits for changing h in one step
+    safety, grow_max, shrink_min = 0.9, 5.0, 0.2
+
+    t = t0
+    y = np.array(y0, dtype=np.float64)
+    times = [t]
+    y_values = [y]
+    k1 = None
+    while t < t_max:
+        if len(times) > max_steps:
+            raise RuntimeError("integrate_adaptive: more than {0} steps "
+                               "needed to reach t_max={1}".format(max_steps, t_max))
+        # do not step beyond t_max
+        h = min(h, t_max - t)
+        y_new, error, k7 = rk45(y, f, t, h, k1=k1)
+        scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+        err = np.sqrt(np.mean((error/scale)**2))
+        if err <= 1:
+            # accept step
+            t += h
+            y = y_new
+            k1 = k7
+            times.append(t)
+            y_values.append(y)
+        factor = grow_max if err == 0 else safety * err**(-1/5)
+        h *= min(grow_max, max(shrink_min, factor))
+        if h < h_min:
+            raise RuntimeError("integrate_adaptive: step size h={0} smaller "
+                               "than h_min={1} at t={2}".format(h, h_min, t))
+
+    return np.array(times), np.array(y_values)
+
+
+#------------------------------------------------------------
+# integration with event detection
+#
+# An event function g(t, y) signals an event when it changes sign,
+# e.g., g(t, y) = y[1] is zero when a projectile with y = [x, y, vx,
+# vy] hits the ground. After each step the sign of g is checked. When
+# it changed, the solution between the two steps is approximated by
+# the cubic Hermite polynomial through y(t), y(t+h) with slopes
+# f(t, y(t)) and f(t+h, y(t+h)) ("dense output") and the time of the
+# event is the root of g(t, hermite(t)), found with a root finder such
+# as your bisection() from the lesson. The event time is therefore
+# accurate without making h smaller.
+#
+# Optional attributes of the event function (as in scipy):
+#   g.terminal = True     stop the integration at the first event
+#   g.direction = 1 / -1  only count crossings from - to + / + to -
+
+def hermite(t, t0, y0, f0, t1, y1, f1):
+    """Cubic Hermite interpolation of y(t) between t0 and t1.
+
+    `f0` and `f1` are the derivatives (ODE force vectors) at `t0`
+    and `t1`.
+    """
+    h = t1 - t0
+    s = (t - t0)/h
+    h00 = (1 + 2*s) * (1 - s)**2
+    h10 = s * (1 - s)**2
+    h01 = s**2 * (3 - 2*s)
+    h11 = s**2 * (s - 1)
+    return h00*y0 + h10*h*f0 + h01*y1 + h11*h*f1
+
+def integrate(f, y0, t0=0, t_max=1, h=0.01, integrator=rk4, events=None,
+              root_finder=None):
+    """Integrate the ODE `f(t, y)` with fixed steps and detect events.
+
+    Arguments
+    ---------
+    f : function `f(t, y)`
+        ODE force vector
+    y0 : array
+        initial value of the ODE standard form vector at `t0`
+    t0 : float
+        start time
+    t_max : float
+        time to integrate out to
+    h : float
+        integration time step
+    integrator : function `I(y, f, t, h)`
+        integrator such as :func:`rk4`
+    events : list, optional
+        event functions `g(t, y)`; an event happens where `g` changes
+        sign. If an event function has the attribute ``terminal =
+        True`` then the integration stops at the first event and the
+        event is the last point of the trajectory. The attribute
+        `direction` (+1 or -1) restricts events to crossings from
+        negative to positive (or positive to negative).
+    root_finder : function `root_finder(g, a, b)`
+        returns the root of `g` in the bracket [a, b], e.g., your
+        ``bisection``; required with `events`
+
+    Returns
+    -------
+    Tuple ``(t, y)`` with times and ODE standard form vectors. With
+    `events`, the tuple ``(t, y, t_events, y_events)`` is returned where
+    ``t_events[i]`` and ``y_events[i]`` are arrays with the times and
+    states of all events of ``events[i]``.
+
+    Example
+    -------
+    Impact of a projectile with y = [x, y, vx, vy]::
+
+       def hit_ground(t, y):
+           return y[1]
+       hit_ground.terminal = True
+       hit_ground.direction = -1
+
+       t, y, t_events, y_events = integrate(f, y0, t_max=100, h=0.01,
+                                            events=[hit_ground],
+                                            root_finder=bisection)
+       t_impact, x_impact = t_events[0][0], y_events[0][0][0]
+
+    """
+    events = [] if events is None else list(events)
+    if events and root_finder is None:
+        raise ValueError("events need a root_finder(g, a, b) such as bisection()")
+    t = t0
+    y = np.array(y0, dtype=np.float64)
+    times = [t]
+    y_values = [y]
+    t_events = [[] for g in events]
+    y_events = [[] for g in events]
+    g_values = [g(t, y) for g in events]
+
+    # use the same number of steps as h * np.arange(...)
+    Nsteps = int(round((t_max - t0)/h))
+    for i in range(Nsteps):
+        t_new = t0 + (i + 1)*h
+        y_new = integrator(y.copy(), f, t, t_new - t)
+        stop = False
+        f0 = f1 = None
+        step_events = []
+        for j, g in enumerate(events):
+            g_old, g_new = g_values[j], g(t_new, y_new)
+            g_values[j] = g_new
+            direction = getattr(g, "direction", 0)
+            crossed = (g_old < 0 <= g_new) or (g_old > 0 >= g_new)
+            if not crossed or direction * (g_new - g_old) < 0:
+                continue
+            if f0 is None:
+                # dense output, only needed when there is an event
+                f0, f1 = f(t, y), f(t_new, y_new)
+
+            def g_dense(s):
+                return g(s, hermite(s, t, y, f0, t_new, y_new, f1))
 
+            t_event = root_finder(g_dense, t, t_new)
+            y_event = hermite(t_event, t, y, f0, t_new, y_new, f1)
+            step_events.append((j, t_event, y_event))
+            if getattr(g, "terminal", False):
+                # stop at the earliest terminal event
+                if not stop or t_event < t_stop:
+                    t_stop, y_stop = t_event, y_event
+                stop = True
+        for j, t_event, y_event in step_events:
+            # events after a terminal event did not happen
+            if not stop or t_event <= t_stop:
+                t_events[j].append(t_event)
+                y_events[j].append(y_event)
+        if stop:
+            times.append(t_stop)
+            y_values.append(y_stop)
+            break
+        t, y = t_new, y_new
+        times.append(t)
+        y_values.append(y)
 
+    if not events:
+        return np.array(times), np.array(y_values)
+    return (np.array(times), np.array(y_values),
+            [np.array(te) for te in t_events], [np.array(ye) for ye in y_events])
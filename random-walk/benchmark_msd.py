@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Benchmark of the FFT MSD against the direct loop over lag times
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# Generates N 2D lattice random walks of increasing length T and
+# times msd_direct() (O(T^2)) and msd_fft() (O(T log T)); also checks
+# that both give the same MSD.
+#
+# Usage:
+#
+#   python benchmark_msd.py --walkers 100 --lengths 100 1000 10000
+
+import argparse
+import time
+
+import numpy as np
+
+from msd import msd_direct, msd_fft
+
+
+def random_walks(N, T, d=2, seed=494):
+    """N lattice random walks with T steps in d dimensions, shape (N, T, d)."""
+    rng = np.random.default_rng(seed)
+    axis = rng.integers(0, d, (N, T))
+    sign = 2*rng.integers(0, 2, (N, T)) - 1
+    steps = np.zeros((N, T, d), dtype=np.int64)
+    np.put_along_axis(steps, axis[:, :, np.newaxis], sign[:, :, np.newaxis], axis=-1)
+    return np.cumsum(steps, axis=1)
+
+
+def timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FFT vs direct MSD")
+    parser.add_argument("-N", "--walkers", type=int, default=100,
+                        help="number of walks")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 1000, 5000],
+                        help="lengths T of the walks")
+    parser.add_argument("--chunksize", type=int, default=10,
+                        help="walks per chunk for the chunked FFT run")
+    args = parser.parse_args()
+
+    print("{0:>8s} {1:>12s} {2:>12s} {3:>12s} {4:>10s} {5:>10s}".format(
+        "T", "direct/s", "fft/s", "chunked/s", "speedup", "max diff"))
+    for T in args.lengths:
+        r = random_walks(args.walkers, T)
+        direct, t_direct = timeit(msd_direct, r)
+        fft, t_fft = timeit(msd_fft, r)
+        chunked, t_chunked = timeit(msd_fft, r, chunksize=args.chunksize)
+        diff = max(np.max(np.abs(fft - direct)), np.max(np.abs(chunked - direct)))
+        print("{0:8d} {1:12.4f} {2:12.4f} {3:12.4f} {4:10.1f} {5:10.2g}".format(
+            T, t_direct, t_fft, t_chunked, t_direct/t_fft, diff))
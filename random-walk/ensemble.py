@@ -0,0 +1,196 @@
+# Random walk ensembles with streaming statistics
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# N walkers take M steps each, on a lattice (one of the 2d nearest
+# neighbor directions at random, as in the random-walk notebooks) or
+# off-lattice (unit steps in uniformly random directions). The steps
+# for all walkers are drawn for a block of time steps at once and the
+# positions follow with a cumulative sum along time, starting from
+# the positions at the end of the previous block. The block length
+# is chosen so that a block has at most `maxsize` numbers, so memory
+# use does not depend on M.
+#
+# Blocks are stored time-major, shape (time, N, d): the positions of
+# all walkers at one time are contiguous in memory, so that the
+# cumulative sum along axis 0 adds contiguous arrays (much faster than
+# np.cumsum along axis 1 of a (N, time, d) array).
+#
+# WalkStatistics accumulates <R^2>(t), the mean end-to-end distance
+# and histograms of the end points from the blocks, so the paths are
+# never stored. For example, for 10^6 walkers in 2D
+#
+#   stats = ensemble_statistics(10**6, 100, d=2)
+#   plt.plot(stats.times, stats.msd)
+#   print(stats.mean_end_to_end)
+
+import numpy as np
+
+def random_steps(rng, shape, d=1, lattice=True):
+    """Draw random unit steps.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        random number generator
+    shape : tuple
+        shape of the array of steps, e.g., ``(N, M)``
+    d : int
+        dimension
+    lattice : bool
+        lattice steps along +/- one of the d axes (integers) or
+        off-lattice unit vectors in random directions
+
+    Returns
+    -------
+    steps : array
+        steps with shape ``shape + (d,)``
+    """
+    if lattice or d == 1:
+        # the 2d directions -e_0, +e_0, -e_1, +e_1, ... (in 1D, these
+        # are also the only off-lattice unit steps)
+        directions = np.repeat(np.eye(d, dtype=np.int8), 2, axis=0)
+        directions[::2] *= -1
+        k = rng.integers(0, 2*d, size=shape, dtype=np.int8)
+        return np.take(directions, k, axis=0)
+    # normal distributed vectors point in uniformly random directions
+    steps = rng.standard_normal(shape + (d,))
+    steps /= np.sqrt(np.einsum('...i,...i->...', steps, steps))[..., np.newaxis]
+    return steps
+
+def walk_ensemble(N, M, d=1, lattice=True, seed=None, maxsize=2**24):
+    """Generate the positions of N random walkers in blocks of time steps.
+
+    Parameters
+    ----------
+    N : int
+        number of walkers
+    M : int
+        number of steps
+    d : int
+        dimension (1, 2, 3, ...)
+    lattice : bool
+        lattice or off-lattice walk (see :func:`random_steps`)
+    seed : int, optional
+        seed for the random number generator
+    maxsize : int
+        maximum number of positions (N x block length x d) in a block
+
+    Yields
+    ------
+    t, positions
+        times (steps) t of the block and the positions with shape
+        ``(len(t), N, d)`` (time-major; ``positions[:, j]`` is the path
+        of walker j); all walkers start at the origin at t = 0, which
+        is not included
+    """
+    rng = np.random.default_rng(seed)
+    blocksize = max(maxsize // (N*d), 1)
+    dtype = np.int64 if lattice else np.float64
+    current = np.zeros((N, d), dtype=dtype)
+    for start in range(0, M, blocksize):
+        n = min(blocksize, M - start)
+        steps = random_steps(rng, (n, N), d=d, lattice=lattice)
+        # cumulative sum along time, continuing from the last block
+        positions = np.empty((n, N, d), dtype=dtype)
+        np.cumsum(steps, axis=0, dtype=dtype, out=positions)
+        positions += current
+        current = positions[-1]
+        yield np.arange(start + 1, start + n + 1), positions
+
+class WalkStatistics:
+    """Running statistics of a random walk ensemble.
+
+    Attributes
+    ----------
+    times : array
+        t = 0, 1, ..., M
+    msd : array
+        mean squared end-to-end distance <R^2>(t)
+    mean_end_to_end : float
+        mean end-to-end distance <|R(M)|>
+    hist_R, edges_R : arrays
+        histogram of |R(M)|
+    hist_x, edges_x : arrays
+        histogram of the coordinates of R(M) (all d components)
+    """
+
+    def __init__(self, M, d=1, bins=50, bins_range=None):
+        """Set up accumulators for walks with M steps in d dimensions.
+
+        Arguments
+        ---------
+        M : int
+            number of steps
+        d : int
+            dimension
+        bins : int
+            number of histogram bins
+        bins_range : float, optional
+            histograms cover [-bins_range, bins_range] for the
+            coordinates and [0, bins_range] for |R|; the default is
+            5 sqrt(M) (end points outside the range are not counted)
+        """
+        self.M = M
+        self.d = d
+        self.bins_range = 5*np.sqrt(M) if bins_range is None else bins_range
+        self.times = np.arange(M + 1)
+        self.n = 0
+        self._sum_R2 = np.zeros(M + 1)
+        self._sum_R = 0.
+        self.edges_x = np.linspace(-self.bins_range, self.bins_range, bins + 1)
+        self.edges_R = np.linspace(0, self.bins_range, bins + 1)
+        self.hist_x = np.zeros(bins, dtype=np.int64)
+        self.hist_R = np.zeros(bins, dtype=np.int64)
+
+    def update(self, t, positions, first=False):
+        """Accumulate a block of `positions` (len(t), N, d) at times `t`.
+
+        Set `first` for the first block of a new set of walkers.
+        """
+        if first:
+            self.n += positions.shape[1]
+        self._sum_R2[t] += np.einsum('tnd,tnd->t', positions, positions)
+        if t[-1] == self.M:
+            end = positions[-1].astype(np.float64)
+            R = np.sqrt(np.sum(end**2, axis=-1))
+            self._sum_R += np.sum(R)
+            self.hist_x += np.histogram(end, bins=self.edges_x)[0]
+            self.hist_R += np.histogram(R, bins=self.edges_R)[0]
+
+    @property
+    def msd(self):
+        return self._sum_R2 / self.n
+
+    @property
+    def mean_end_to_end(self):
+        return self._sum_R / self.n
+
+def ensemble_statistics(N, M, d=1, lattice=True, seed=None, bins=50, bins_range=None,
+                        chunksize=None, maxsize=2**24):
+    """Statistics of N random walks with M steps without storing the paths.
+
+    Parameters
+    ----------
+    N, M, d, lattice, seed, maxsize
+        as for :func:`walk_ensemble`
+    bins, bins_range
+        histogram settings (see :class:`WalkStatistics`)
+    chunksize : int, optional
+        simulate `chunksize` walkers at a time (default: all N)
+
+    Returns
+    -------
+    stats : WalkStatistics
+    """
+    stats = WalkStatistics(M, d=d, bins=bins, bins_range=bins_range)
+    chunksize = N if chunksize is None else chunksize
+    rng = np.random.default_rng(seed)
+    for start in range(0, N, chunksize):
+        n = min(chunksize, N - start)
+        # independent random streams for the chunks
+        chunk_seed = rng.integers(2**63)
+        for i, (t, positions) in enumerate(walk_ensemble(n, M, d=d, lattice=lattice,
+                                                         seed=chunk_seed, maxsize=maxsize)):
+            stats.update(t, positions, first=(i == 0))
+    return stats
@@ -0,0 +1,119 @@
+# Mean squared displacement of random walks
+# Copyright (c) 2016-2021 Oliver Beckstein.
+# License: BSD-3 clause
+
+# The time-averaged mean squared displacement (MSD) of a walk r(t)
+# with T positions for the lag time m is
+#
+#   MSD(m) = 1/(T - m) sum_{k=0}^{T-m-1} |r(k + m) - r(k)|^2
+#
+# Calculating it directly for all lags costs O(T^2) per walker
+# (msd_direct()). Expanding the square gives
+#
+#   MSD(m) = S1(m) - 2 S2(m)
+#
+#   S1(m) = 1/(T - m) sum_k (|r(k)|^2 + |r(k + m)|^2)
+#   S2(m) = 1/(T - m) sum_k r(k) . r(k + m)
+#
+# S1 is obtained from cumulative sums of |r|^2 and S2 is the
+# autocorrelation of r, which is calculated with the FFT (zero-padded
+# to avoid periodic wrap-around) in O(T log T) (msd_fft()).
+#
+# All functions take an array of N walks with T positions in d
+# dimensions, shape (N, T, d), or (N, T) in 1D.
+
+import numpy as np
+
+def _as_walks(positions):
+    """Return positions as a (N, T, d) float array."""
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.ndim == 2:
+        positions = positions[:, :, np.newaxis]
+    return positions
+
+def msd_direct(positions, average=True):
+    """MSD for all lag times with an explicit loop over lags (O(T^2)).
+
+    Parameters
+    ----------
+    positions : array
+        N walks with T positions each, shape (N, T, d) or (N, T)
+    average : bool
+        average over the N walks
+
+    Returns
+    -------
+    msd : array
+        MSD for lags 0 ... T-1, shape (T,) or (N, T) for
+        ``average=False``
+    """
+    r = _as_walks(positions)
+    N, T, d = r.shape
+    msd = np.zeros((N, T))
+    for m in range(1, T):
+        dr = r[:, m:] - r[:, :-m]
+        msd[:, m] = np.mean(np.sum(dr**2, axis=-1), axis=1)
+    return msd.mean(axis=0) if average else msd
+
+def _msd_fft(r):
+    """MSD for all lags of the walks `r` (N, T, d), shape (N, T)."""
+    N, T, d = r.shape
+    lags = T - np.arange(T)
+
+    # S1 from cumulative sums of D = |r|^2 from both ends
+    D = np.sum(r**2, axis=-1)
+    Q = 2*np.sum(D, axis=1, keepdims=True)
+    removed = np.zeros((N, T))
+    removed[:, 1:] = np.cumsum(D[:, :-1] + D[:, :0:-1], axis=1)
+    S1 = (Q - removed) / lags
+
+    # S2 = autocorrelation, FFT padded to at least 2T
+    nfft = 2**int(np.ceil(np.log2(2*T)))
+    F = np.fft.rfft(r, n=nfft, axis=1)
+    power = np.sum(F.real**2 + F.imag**2, axis=-1)
+    S2 = np.fft.irfft(power, n=nfft, axis=1)[:, :T] / lags
+
+    msd = S1 - 2*S2
+    msd[:, 0] = 0
+    return msd
+
+def msd_fft(positions, average=True, chunksize=None, out=None):
+    """MSD for all lag times with the FFT method (O(T log T)).
+
+    Parameters
+    ----------
+    positions : array
+        N walks with T positions each, shape (N, T, d) or (N, T); can
+        be a memmap
+    average : bool
+        average over the N walks
+    chunksize : int, optional
+        process `chunksize` walks at a time so that only a few arrays
+        of size `chunksize` x T x d are in memory; the default is to
+        process all walks at once
+    out : array, optional
+        (N, T) array for the MSD of each walk with ``average=False``
+        (can be a memmap)
+
+    Returns
+    -------
+    msd : array
+        MSD for lags 0 ... T-1, shape (T,) or (N, T) for
+        ``average=False``
+    """
+    if np.ndim(positions) == 2:
+        positions = positions[:, :, np.newaxis]
+    N, T = np.shape(positions)[:2]
+    chunksize = N if chunksize is None else chunksize
+
+    if average:
+        total = np.zeros(T)
+    else:
+        msd = np.empty((N, T)) if out is None else out
+    for start in range(0, N, chunksize):
+        chunk = _msd_fft(_as_walks(positions[start:start + chunksize]))
+        if average:
+            total += np.sum(chunk, axis=0)
+        else:
+            msd[start:start + len(chunk)] = chunk
+    return total / N if average else msd